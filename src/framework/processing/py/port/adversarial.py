@@ -0,0 +1,152 @@
+"""
+Adversarial corpus: TikTok exports that are built to make the extractors slow or use a lot of memory
+
+Every case is a zip with one malformed file (very long lines, no newlines, invalid utf-8, ...).
+Every enabled table of script.TIKTOK_TABLES is extracted from every case with a tight time budget,
+a case fails when an extractor raises or runs well past its budget (see port.budget).
+The cases are written to OUTPUT_DIR/corpus/<case>.zip and the results to OUTPUT_DIR/report.json
+
+Usage: python -m port.adversarial OUTPUT_DIR [--size BYTES] [--max-seconds S]
+"""
+
+from pathlib import Path
+from typing import Any, Callable
+import argparse
+import zipfile
+import logging
+import random
+import json
+import time
+
+import port.script as script
+import port.tiktok as tiktok
+from port.budget import Budget, Watchdog
+
+logger = logging.getLogger(__name__)
+
+
+def _repeat(unit: str, size: int) -> str:
+    return unit * max(1, size // len(unit))
+
+
+# Case name, file in the zip and a function that creates its content of about size bytes
+CASES: list[tuple[str, str, Callable[[int], bytes]]] = [
+    ("long_date_line", "Browsing History.txt", lambda size: ("Date: " + "1" * size).encode()),
+    ("long_link_line", "Like List.txt", lambda size: ("Date: 2023-01-01 00:00:00\nLink: " + "a" * size).encode()),
+    ("dates_without_links", "Like List.txt", lambda size: _repeat("Date: 2023-01-01 00:00:00\n", size).encode()),
+    ("links_without_dates", "Browsing History.txt", lambda size: _repeat(
+        "Link: https://www.tiktokv.com/\n", size
+    ).encode()),
+    ("carriage_returns_only", "Share History.txt", lambda size: _repeat(
+        "Date: 2023-01-01 00:00:00\rShared Content: video\rLink: x\rMethod: copy\r\r", size
+    ).encode()),
+    ("chat_header_whitespace", "Direct Messages.txt", lambda size: (
+        ">>> Chat History with " + " " * size + "x\n"
+    ).encode()),
+    ("chat_header_colons", "Direct Messages.txt", lambda size: (
+        ">>> Chat History with " + ":" * size + " x\n"
+    ).encode()),
+    ("many_conversations", "Direct Messages.txt", lambda size: _repeat(
+        ">>> Chat History with a:\nDate: 2023-01-01 00:00:00\nFrom: a\nContent: x\n\n", size
+    ).encode()),
+    ("long_message_content", "Direct Messages.txt", lambda size: (
+        ">>> Chat History with a:\nDate: 2023-01-01 00:00:00\nFrom: a\nContent: x\n" + _repeat("y" * 50 + "\n", size)
+    ).encode()),
+    ("many_interests", "Settings.txt", lambda size: ("Interests: " + _repeat("a|", size)).encode()),
+    ("invalid_utf8", "Searches.txt", lambda size: random.Random(0).randbytes(size)),
+    ("many_duplicates", "Browsing History.txt", lambda size: _repeat(
+        "Date: 2023-01-01 00:00:00\nLink: https://www.tiktokv.com/share/video/1/\n\n", size
+    ).encode()),
+]
+
+
+def write_case(directory: Path, name: str, file_name: str, content: bytes) -> str:
+    """
+    Writes a zip with content as file_name, next to a valid Settings.txt so the zip is recognized as TikTok
+    """
+    path = directory / f"{name}.zip"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(f"TikTok/Activity/{file_name}", content)
+        if file_name != "Settings.txt":
+            zf.writestr("TikTok/App Settings/Settings.txt", "Interests: Comedy\n")
+    return str(path)
+
+
+def run_case(zip_path: str, max_seconds: float) -> dict[str, Any]:
+    """
+    Extracts every enabled table from zip_path with a time budget of max_seconds
+    """
+    tables: dict[str, Any] = {}
+    for spec in script.TIKTOK_TABLES:
+        if not spec.enabled:
+            continue
+
+        budget = Budget(max_seconds, spec.budget.max_input_bytes, spec.budget.max_rows)
+        watchdog = Watchdog(spec.name, budget)
+        result: dict[str, Any] = {}
+        try:
+            result["rows"] = len(spec.extract(zip_path, tiktok.NO_FILTER, watchdog))
+        except Exception as e:
+            logger.error("%s of %s raised: %s", spec.name, zip_path, e)
+            result["error"] = repr(e)
+        result.update(watchdog.metrics())
+        # the watchdog only looks at the clock now and then, give it some slack
+        result["failed"] = "error" in result or result["seconds"] > 2 * max_seconds + 1
+        tables[spec.name] = result
+
+    return tables
+
+
+def run(output_dir: str, size: int = 10_000_000, max_seconds: float = 5.0) -> dict[str, Any]:
+    """
+    Writes the corpus with payloads of about size bytes and extracts every case
+    Writes and returns the report
+    """
+    corpus_dir = Path(output_dir) / "corpus"
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+
+    results = {}
+    for name, file_name, create in CASES:
+        zip_path = write_case(corpus_dir, name, file_name, create(size))
+        start = time.perf_counter()
+        tables = run_case(zip_path, max_seconds)
+        results[name] = {
+            "file": zip_path,
+            "seconds": round(time.perf_counter() - start, 4),
+            "failed": any(table["failed"] for table in tables.values()),
+            "exceeded": sorted(
+                {f"{table['name']}: {table['exceeded']}" for table in tables.values() if table["exceeded"]}
+            ),
+            "tables": tables,
+        }
+
+    report = {
+        "size": size,
+        "max_seconds": max_seconds,
+        "n_cases": len(results),
+        "n_failed": sum(result["failed"] for result in results.values()),
+        "results": results,
+    }
+
+    report_path = Path(output_dir) / "report.json"
+    report_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return report
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the extractors on a corpus of adversarial TikTok exports")
+    parser.add_argument("output_dir", help="directory for the corpus and report.json")
+    parser.add_argument("--size", type=int, default=10_000_000, help="size in bytes of the malformed file of a case")
+    parser.add_argument("--max-seconds", type=float, default=5.0, help="time budget per table")
+    args = parser.parse_args(argv)
+
+    report = run(args.output_dir, args.size, args.max_seconds)
+    for name, result in report["results"].items():
+        status = "FAILED" if result["failed"] else "ok"
+        print(f"{name:<24} {status:<6} {result['seconds']:>8.2f}s  {', '.join(result['exceeded'])}")
+    print(f"{report['n_cases']} cases, {report['n_failed']} failed")
+    return 1 if report["n_failed"] > 0 else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,6 +1,8 @@
-from dataclasses import dataclass
-from typing import Optional, TypedDict
+from dataclasses import dataclass, field
+from typing import Iterable, Optional, TypedDict
+import json
 
+import numpy as np
 import pandas as pd
 
 
@@ -51,9 +53,12 @@ class PropsUIFooter:
         progressPercentage: float indicating the progress in the flow
     """
 
+    progressPercentage: Optional[float] = None
+
     def toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIFooter"
+        dict["progressPercentage"] = self.progressPercentage
         return dict
 
 
@@ -83,6 +88,106 @@ class PropsUIPromptConfirm:
         return dict
 
 
+# Version of the table wire format, see data_frame_to_json
+TABLE_FORMAT_VERSION = 2
+
+
+def _is_repetitive(column: pd.Series) -> bool:
+    """
+    Columns with strings that repeat a lot (for example "Gedeeld via") are dictionary encoded
+    """
+    if column.dtype != object or len(column) < 2:
+        return False
+    try:
+        return column.nunique(dropna=True) <= len(column) // 2
+    except TypeError:
+        # unhashable cells (lists, dicts) cannot be dictionary encoded
+        return False
+
+
+def _column_names(df: pd.DataFrame) -> list[str]:
+    """
+    Column names as unique strings, duplicates get a suffix like pandas read_csv does: "Link", "Link.1"
+    """
+    names: list[str] = []
+    seen: set[str] = set()
+    for column in df.columns:
+        name = base = str(column)
+        i = 0
+        while name in seen:
+            i += 1
+            name = f"{base}.{i}"
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def _json_values(values: pd.Series) -> str:
+    """
+    Encodes values as a json array, strings are encoded with json.dumps (compact, no escaped slashes)
+    other types as pandas would encode them in DataFrame.to_json()
+    """
+    if pd.api.types.infer_dtype(values, skipna=True) in ("string", "empty"):
+        strings = values.astype(object).where(values.notna(), None).tolist()
+        return json.dumps(strings, ensure_ascii=False, separators=(",", ":"))
+    return values.to_json(orient="values")
+
+
+def row_ids(df: pd.DataFrame) -> np.ndarray:
+    """
+    Ids of the rows of a table: the index when it is an integer index, the positions otherwise
+    """
+    if pd.api.types.is_integer_dtype(df.index):
+        return df.index.to_numpy()
+    return np.arange(len(df))
+
+
+def _has_position_ids(df: pd.DataFrame) -> bool:
+    return bool(np.array_equal(row_ids(df), np.arange(len(df))))
+
+
+def data_frame_to_json(df: pd.DataFrame) -> str:
+    """
+    Encodes a table as json with one plain array per column and no index:
+
+    {
+        "__version__": 2,
+        "columns": ["Tijdstip", "Gedeeld via"],
+        "rowCount": 3,
+        "data": {"Tijdstip": ["2023-01-01 10:00:00", ...], "Gedeeld via": [0, 1, 0]},
+        "dictionaries": {"Gedeeld via": ["whatsapp", "copy"]}
+    }
+
+    Columns in "dictionaries" are dictionary encoded: data contains indices into the dictionary, -1 is null.
+    When the row ids (see row_ids) are not the positions 0..n-1, they are added as "rowIds".
+    Tables without "__version__" use the pandas DataFrame.to_json() format (orient="columns")
+    Duplicate column names are made unique (see _column_names)
+    """
+    columns = _column_names(df)
+    data = []
+    dictionaries = []
+
+    for name, (_, column) in zip(columns, df.items()):
+        key = json.dumps(name, ensure_ascii=False)
+        if _is_repetitive(column):
+            codes, uniques = pd.factorize(column)
+            data.append(f"{key}:{json.dumps(codes.tolist(), separators=(',', ':'))}")
+            dictionaries.append(f"{key}:{_json_values(pd.Series(uniques, dtype=object))}")
+        else:
+            data.append(f"{key}:{_json_values(column)}")
+
+    ids = "" if _has_position_ids(df) else f'"rowIds":{json.dumps(row_ids(df).tolist(), separators=(",", ":"))},'
+
+    return (
+        f'{{"__version__":{TABLE_FORMAT_VERSION},'
+        f'"columns":{json.dumps(columns, ensure_ascii=False, separators=(",", ":"))},'
+        f'"rowCount":{len(df)},'
+        f'{ids}'
+        f'"data":{{{",".join(data)}}},'
+        f'"dictionaries":{{{",".join(dictionaries)}}}}}'
+    )
+
+
 @dataclass
 class PropsUIPromptConsentFormTable:
     """Table to be shown to the participant prior to donation
@@ -92,6 +197,14 @@ class PropsUIPromptConsentFormTable:
         title: title of the table
         data_frame: table to be shown
         visualizations: optional visualizations to be shown. (see TODO for input format)
+        total_rows: number of rows of the full table when data_frame is a preview (see helpers.preview_rows)
+
+    The table is encoded once (see data_frame_to_json), the encoding is reused for
+    rendering and donation until a new data_frame is assigned.
+    Modify the table by assigning a new data_frame, not in place.
+
+    The ids of the rows are the index of data_frame (see row_ids),
+    the consent form returns the ids of the rows the participant deleted (see delete_rows)
     """
 
     id: str
@@ -100,16 +213,59 @@ class PropsUIPromptConsentFormTable:
     description: Optional[Translatable] = None
     visualizations: Optional[list] = None
     folded: Optional[bool] = False
+    total_rows: Optional[int] = None
+    _encoded: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    deleted_row_ids: list[int] = field(default_factory=list, init=False, repr=False, compare=False)
+
+    def __setattr__(self, name, value):
+        if name == "data_frame":
+            super().__setattr__("_encoded", None)
+            super().__setattr__("deleted_row_ids", [])
+        super().__setattr__(name, value)
+
+    def delete_rows(self, ids: Iterable[int]) -> int:
+        """
+        Deletes the rows with the given ids from data_frame, unknown ids are ignored
+        The remaining rows keep their ids. Returns the number of rows deleted
+        """
+        df = self.data_frame
+        if not pd.api.types.is_integer_dtype(df.index):
+            # positions are the ids, keep them as index so they do not shift
+            df = df.reset_index(drop=True)
+
+        delete = np.isin(row_ids(df), np.asarray(list(ids), dtype=np.int64))
+        n_deleted = int(delete.sum())
+        if n_deleted == 0:
+            return 0
+
+        deleted_row_ids = sorted(self.deleted_row_ids + row_ids(df)[delete].tolist())
+        self.data_frame = df[~delete]
+        self.deleted_row_ids = deleted_row_ids
+        return n_deleted
+
+    @property
+    def encoded_data_frame(self) -> str:
+        if self._encoded is None:
+            self._encoded = data_frame_to_json(self.data_frame)
+        return self._encoded
+
+    def donation_json(self, key: str) -> str:
+        """
+        Returns {key: table} as json, with the table in the encoding of data_frame_to_json
+        This is the format of every donated table, also of the batches of helpers.iter_encoded_batches
+        """
+        return f"{{{json.dumps(key)}: {self.encoded_data_frame}}}"
 
     def toDict(self):
         dict = {}
         dict["__type__"] = "PropsUIPromptConsentFormTable"
         dict["id"] = self.id
         dict["title"] = self.title.toDict()
-        dict["data_frame"] = self.data_frame.to_json()
+        dict["data_frame"] = self.encoded_data_frame
         dict["description"] = self.description.toDict() if self.description else None
         dict["visualizations"] = self.visualizations if self.visualizations else None
         dict["folded"] = self.folded
+        dict["total_rows"] = self.total_rows
         return dict
 
 
@@ -306,6 +462,29 @@ class PropsUIPromptQuestionnaire:
         return dict
 
 
+@dataclass
+class PropsUIPromptProgress:
+    """Shows that the script is busy
+
+    The page resolves itself as soon as it is shown, so the script can continue
+    while the participant looks at it. The progress is shown in the footer of the page.
+
+    Attributes:
+        description: text to display
+        message: status message to display, for example the percentage
+    """
+
+    description: Translatable
+    message: str
+
+    def toDict(self):
+        dict = {}
+        dict["__type__"] = "PropsUIPromptProgress"
+        dict["description"] = self.description.toDict()
+        dict["message"] = self.message
+        return dict
+
+
 @dataclass
 class PropsUIPageDonation:
     """A multi-purpose page that gets shown to the user
@@ -324,6 +503,7 @@ class PropsUIPageDonation:
         | PropsUIPromptFileInput
         | PropsUIPromptConfirm
         | PropsUIPromptQuestionnaire
+        | PropsUIPromptProgress
     )
     footer: Optional[PropsUIFooter] = None
 
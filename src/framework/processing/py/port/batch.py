@@ -0,0 +1,207 @@
+"""
+Batch mode: runs the TikTok validation and extractors over a directory of zips
+
+Every zip is processed in its own worker process, an error in one zip does not affect the others.
+Every table of script.TIKTOK_TABLES is extracted, also the ones that are disabled in the browser,
+and without the budgets of the browser. With --budget every table is extracted within the budget of its spec
+(see port.budget), tables that were cut off are marked in the summary.
+The tables of every zip are written to OUTPUT_DIR/<zip name>/<table>.parquet
+(or <table>.json in the format of props.data_frame_to_json when pyarrow is not installed)
+and a summary of the run, with timings, is written to OUTPUT_DIR/summary.json
+
+Usage: python -m port.batch INPUT_DIR OUTPUT_DIR [--workers N] [--format parquet|json] [--budget]
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from importlib.util import find_spec
+from pathlib import Path
+from typing import Any
+import argparse
+import logging
+import json
+import time
+import os
+
+import pandas as pd
+
+import port.tiktok as tiktok
+import port.script as script
+from port.api.props import data_frame_to_json
+from port.budget import NO_BUDGET, Watchdog
+
+logger = logging.getLogger(__name__)
+
+# Table name and its spec, every table in script.TIKTOK_TABLES
+TABLES: dict[str, script.TableSpec] = {spec.name.removeprefix("tiktok_"): spec for spec in script.TIKTOK_TABLES}
+
+OUTPUT_FORMATS = ["parquet", "json"]
+
+
+def default_output_format() -> str:
+    """
+    Parquet if pyarrow is installed, json otherwise
+    """
+    return "parquet" if find_spec("pyarrow") is not None else "json"
+
+
+def write_table(df: pd.DataFrame, path_without_suffix: Path, output_format: str) -> Path:
+    """
+    Writes df in the output format, returns the path of the file written
+    """
+    if output_format == "parquet":
+        path = path_without_suffix.with_suffix(".parquet")
+        df.to_parquet(path, index=False)
+    else:
+        path = path_without_suffix.with_suffix(".json")
+        path.write_text(data_frame_to_json(df), encoding="utf-8")
+    return path
+
+
+def process_zip(zip_path: str, output_dir: str, output_format: str, use_budget: bool = False) -> dict[str, Any]:
+    """
+    Validates a zip and writes every table that could be extracted
+    Tables are extracted in full, or within the budget of their spec when use_budget is set
+    Returns the result of the zip for the run summary, errors are recorded in the result
+    """
+    start = time.perf_counter()
+    result: dict[str, Any] = {"file": zip_path, "status": "failed", "tables": {}}
+
+    try:
+        validation = tiktok.validate(Path(zip_path))
+        result["validate_seconds"] = round(time.perf_counter() - start, 4)
+        result["status_code"] = validation.status_code.id  # pyright: ignore
+        result["ddp_category"] = validation.ddp_category.id if validation.ddp_category else None
+
+        if validation.status_code.id != 0:  # pyright: ignore
+            result["status"] = "invalid"
+            return result
+
+        export_dir = Path(output_dir) / Path(zip_path).stem
+        export_dir.mkdir(parents=True, exist_ok=True)
+
+        for name, spec in TABLES.items():
+            table_start = time.perf_counter()
+            table: dict[str, Any] = {}
+            watchdog = Watchdog(name, spec.budget if use_budget else NO_BUDGET)
+            try:
+                df = spec.extract(zip_path, tiktok.NO_FILTER, watchdog)
+                table["rows"] = len(df)
+                table["input_bytes"] = watchdog.input_bytes
+                # the table was cut off at its budget, see port.budget
+                table["budget_exceeded"] = watchdog.exceeded
+                if not df.empty:
+                    table["path"] = str(write_table(df, export_dir / name, output_format))
+            except Exception as e:
+                logger.error("Table %s of %s failed: %s", name, zip_path, e)
+                table["error"] = repr(e)
+            table["seconds"] = round(time.perf_counter() - table_start, 4)
+            result["tables"][name] = table
+
+        result["status"] = "ok"
+
+    except Exception as e:
+        logger.error("%s failed: %s", zip_path, e)
+        result["error"] = repr(e)
+
+    finally:
+        result["seconds"] = round(time.perf_counter() - start, 4)
+
+    return result
+
+
+def run(
+    input_dir: str,
+    output_dir: str,
+    workers: int | None = None,
+    output_format: str | None = None,
+    use_budget: bool = False,
+) -> dict[str, Any]:
+    """
+    Processes every zip in input_dir in a pool of workers (default: one per core)
+    Writes and returns the run summary
+    """
+    output_format = output_format or default_output_format()
+    workers = workers or os.cpu_count() or 1
+    zip_paths = sorted(str(p) for p in Path(input_dir).glob("*.zip"))
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    started = datetime.now(timezone.utc).isoformat()
+    start = time.perf_counter()
+    results = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(process_zip, zip_path, output_dir, output_format, use_budget): zip_path
+            for zip_path in zip_paths
+        }
+        for future in as_completed(futures):
+            zip_path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # the worker itself died, for example when it ran out of memory
+                logger.error("%s failed: %s", zip_path, e)
+                result = {"file": zip_path, "status": "failed", "tables": {}, "error": repr(e)}
+            logger.info("%s: %s (%.2fs)", zip_path, result["status"], result.get("seconds", 0))
+            results.append(result)
+
+    results.sort(key=lambda result: result["file"])
+    summary = {
+        "started": started,
+        "seconds": round(time.perf_counter() - start, 4),
+        "workers": workers,
+        "format": output_format,
+        "budget": use_budget,
+        "n_files": len(results),
+        "n_ok": sum(result["status"] == "ok" for result in results),
+        "n_invalid": sum(result["status"] == "invalid" for result in results),
+        "n_failed": sum(result["status"] == "failed" for result in results),
+        "n_budget_exceeded": sum(
+            any(table.get("budget_exceeded") for table in result["tables"].values()) for result in results
+        ),
+        "results": results,
+    }
+
+    summary_path = Path(output_dir) / "summary.json"
+    summary_path.write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    logger.info("Processed %s zips in %.2fs, summary: %s", len(results), summary["seconds"], summary_path)
+
+    return summary
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the TikTok extraction over a directory of zips")
+    parser.add_argument("input_dir", help="directory with TikTok zips")
+    parser.add_argument("output_dir", help="directory to write the tables and summary.json to")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="number of worker processes (default: number of cores)"
+    )
+    parser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default=None,
+        help="output format (default: parquet if pyarrow is installed)",
+    )
+    parser.add_argument(
+        "--budget",
+        action="store_true",
+        help="extract every table within the budget of the browser, tables can be cut off",
+    )
+    args = parser.parse_args(argv)
+    if args.format == "parquet" and find_spec("pyarrow") is None:
+        parser.error("--format parquet requires pyarrow")
+
+    # importing port configures logging to the donation log stream of script.py, log to stderr instead
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s --- %(name)s --- %(levelname)s --- %(message)s",
+        force=True,
+    )
+
+    summary = run(args.input_dir, args.output_dir, args.workers, args.format, args.budget)
+    return 1 if summary["n_failed"] > 0 else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,118 @@
+"""
+Time and size budgets for the extractors
+
+An extractor gets a Watchdog for its Budget and asks it while it parses whether it may continue.
+When a limit is exceeded the extractor stops and keeps the rows it has so far,
+the watchdog logs the reason and keeps it for the metrics of the run
+"""
+
+from dataclasses import dataclass
+from typing import Any
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Budget:
+    """
+    Limits of one extractor run, None is no limit
+
+    Attributes:
+        max_seconds: wall time of the run
+        max_input_bytes: (uncompressed) bytes read from the file
+        max_rows: rows created
+    """
+
+    max_seconds: float | None = None
+    max_input_bytes: int | None = None
+    max_rows: int | None = None
+
+    def read_size(self) -> int:
+        """
+        Number of bytes to read from a file, one more than the budget so that exceeding it can be detected
+        -1 reads everything (like io.BufferedIOBase.read)
+        """
+        return -1 if self.max_input_bytes is None else self.max_input_bytes + 1
+
+
+NO_BUDGET = Budget()
+
+
+class Watchdog:
+    """
+    Keeps track of one extractor run against its budget
+
+    The extractor calls ok() with its progress while it parses and stops when ok() returns False.
+    The wall time is only looked at every CHECK_TIME_EVERY calls to keep ok() cheap
+    """
+
+    CHECK_TIME_EVERY = 256
+
+    def __init__(self, name: str, budget: Budget = NO_BUDGET) -> None:
+        self.name = name
+        self.budget = budget
+        self.start = time.perf_counter()
+        self.rows = 0
+        self.input_bytes = 0
+        self.exceeded: str | None = None
+        self._calls = 0
+
+    def ok(self, rows: int | None = None, input_bytes: int | None = None) -> bool:
+        """
+        rows: number of rows with the row that is about to be added, call before the row is added
+        input_bytes: number of bytes read so far
+        Returns False when a limit is exceeded
+        """
+        budget = self.budget
+
+        if rows is not None and budget.max_rows is not None and rows > budget.max_rows:
+            return self._exceed("max_rows")
+
+        if input_bytes is not None:
+            self.input_bytes = input_bytes
+            if budget.max_input_bytes is not None and input_bytes > budget.max_input_bytes:
+                return self._exceed("max_input_bytes")
+
+        if budget.max_seconds is not None:
+            self._calls += 1
+            if self._calls % self.CHECK_TIME_EVERY == 0 and self.seconds() > budget.max_seconds:
+                return self._exceed("max_seconds")
+
+        if rows is not None:
+            self.rows = rows
+        return True
+
+    def limit_input(self, data: bytes) -> bytes:
+        """
+        Cuts data (read with Budget.read_size) to the input budget at the end of the last complete line
+        """
+        self.input_bytes = len(data)
+        if self.budget.max_input_bytes is None or len(data) <= self.budget.max_input_bytes:
+            return data
+
+        self._exceed("max_input_bytes")
+        data = data[: self.budget.max_input_bytes]
+        return data[: data.rfind(b"\n") + 1]
+
+    def seconds(self) -> float:
+        return time.perf_counter() - self.start
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "seconds": round(self.seconds(), 4),
+            "input_bytes": self.input_bytes,
+            "rows": self.rows,
+            "exceeded": self.exceeded,
+        }
+
+    def _exceed(self, reason: str) -> bool:
+        if self.exceeded is None:
+            self.exceeded = reason
+            logger.warning(
+                "%s: %s exceeded after %.2fs (%s bytes read, %s rows so far), keeping the partial result",
+                self.name, reason, self.seconds(), self.input_bytes, self.rows,
+            )
+        return False
@@ -0,0 +1,189 @@
+"""
+Headless driver for the donation flow in script.process
+
+Drives port.main.ScriptWrapper like the browser does: render commands are answered
+with scripted payloads, system commands (donations) with PayloadVoid.
+For every command the latency of the send() that produced it and the size of
+the serialized command are recorded.
+
+Usage: python -m port.harness ZIP [--session-id ID]
+"""
+
+from dataclasses import dataclass, asdict
+from types import SimpleNamespace
+from typing import Any, Callable, Iterable
+import argparse
+import logging
+import json
+import time
+
+import port.main as main
+
+logger = logging.getLogger(__name__)
+
+
+class HarnessError(Exception):
+    """Raise when the scripted payloads do not fit the flow"""
+
+
+def payload_json(value: str) -> SimpleNamespace:
+    return SimpleNamespace(__type__="PayloadJSON", value=value)
+
+
+def payload_string(value: str) -> SimpleNamespace:
+    return SimpleNamespace(__type__="PayloadString", value=value)
+
+
+def payload_true() -> SimpleNamespace:
+    return SimpleNamespace(__type__="PayloadTrue", value=True)
+
+
+def payload_false() -> SimpleNamespace:
+    return SimpleNamespace(__type__="PayloadFalse", value=False)
+
+
+def payload_void() -> SimpleNamespace:
+    return SimpleNamespace(__type__="PayloadVoid", value=None)
+
+
+def default_payloads(zip_path: str, deleted_rows: dict[str, list[int]] | None = None) -> list[SimpleNamespace]:
+    """
+    Payloads for a participant that donates zip_path:
+    usage questionnaire, file, consent (optionally with deleted rows) and skips the last questionnaire
+    """
+    consent = json.dumps({"deletedRows": deleted_rows or {}, "user_omissions": "[]"})
+    return [
+        payload_json(json.dumps([])),
+        payload_string(zip_path),
+        payload_json(consent),
+        payload_false(),
+    ]
+
+
+@dataclass
+class Step:
+    """One command yielded by the flow
+
+    Attributes:
+        index: position of the command in the flow
+        command: __type__ of the command
+        name: page and prompt of a render command, key of a donation
+        payload: __type__ of the payload that was sent to get this command
+        seconds: duration of the send() that returned the command, including toDict()
+        size: number of bytes of the serialized command
+    """
+
+    index: int
+    command: str
+    name: str
+    payload: str
+    seconds: float
+    size: int
+
+
+def step_name(command: dict[str, Any]) -> str:
+    if command["__type__"] == "CommandUIRender":
+        page = command["page"]
+        body = page.get("body")
+        return f"{page['__type__']}/{body['__type__']}" if isinstance(body, dict) else page["__type__"]
+    if command["__type__"] == "CommandSystemDonate":
+        return command["key"]
+    return str(command.get("info", ""))
+
+
+def is_progress_page(command: dict[str, Any]) -> bool:
+    """
+    Progress pages (see script.render_progress_page) resolve themselves in the browser
+    """
+    body = command["page"].get("body")
+    return isinstance(body, dict) and body.get("__type__") == "PropsUIPromptProgress"
+
+
+def serialized_size(command: dict[str, Any]) -> int:
+    """
+    Size in bytes of the command as json
+    """
+    return len(json.dumps(command).encode("utf-8"))
+
+
+def drive(
+    payloads: Iterable[SimpleNamespace],
+    session_id: str = "harness",
+    max_steps: int = 10000,
+    on_command: Callable[[dict[str, Any]], None] | None = None,
+) -> list[Step]:
+    """
+    Runs the flow until it exits, answering every render command with the next payload
+    Progress pages are answered with PayloadTrue, like the browser does
+    on_command is called with every command, for example to store the donations (see port.loadtest)
+    Raises HarnessError when a render command comes after the payloads ran out
+    """
+    payloads = iter(payloads)
+    script = main.start(session_id)
+    steps: list[Step] = []
+    payload = None
+
+    for index in range(max_steps):
+        start = time.perf_counter()
+        command = script.send(payload)
+        seconds = time.perf_counter() - start
+
+        steps.append(
+            Step(
+                index=index,
+                command=command["__type__"],
+                name=step_name(command),
+                payload=payload.__type__ if payload is not None else "None",
+                seconds=seconds,
+                size=serialized_size(command),
+            )
+        )
+
+        if on_command is not None:
+            on_command(command)
+
+        if command["__type__"] == "CommandSystemExit":
+            return steps
+
+        if command["__type__"] == "CommandUIRender" and is_progress_page(command):
+            payload = payload_true()
+        elif command["__type__"] == "CommandUIRender":
+            payload = next(payloads, None)
+            if payload is None:
+                raise HarnessError(f"No payload left for step {index}: {steps[-1].name}")
+        else:
+            payload = payload_void()
+
+    raise HarnessError(f"Flow did not exit within {max_steps} steps")
+
+
+def report(steps: list[Step]) -> str:
+    """
+    Formats the steps as a table, with the totals on the last line
+    """
+    lines = [f"{'#':>4}  {'command':<22} {'ms':>10} {'bytes':>12}  name"]
+    for step in steps:
+        lines.append(f"{step.index:>4}  {step.command:<22} {step.seconds * 1000:>10.2f} {step.size:>12}  {step.name}")
+    total_seconds = sum(step.seconds for step in steps)
+    total_size = sum(step.size for step in steps)
+    lines.append(f"{'':>4}  {'total':<22} {total_seconds * 1000:>10.2f} {total_size:>12}")
+    return "\n".join(lines)
+
+
+def main_cli(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the donation flow on a zip without a browser")
+    parser.add_argument("zip", help="TikTok zip to donate")
+    parser.add_argument("--session-id", default="harness")
+    parser.add_argument("--json", action="store_true", help="print the steps as json")
+    args = parser.parse_args(argv)
+
+    steps = drive(default_payloads(args.zip), args.session_id)
+    if args.json:
+        print(json.dumps([asdict(step) for step in steps], indent=2))
+    else:
+        print(report(steps))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main_cli())
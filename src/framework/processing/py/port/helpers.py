@@ -1,6 +1,12 @@
+from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Any
+from typing import Any, Callable, Iterable, Iterator
 import warnings
+import itertools
+import random
+import heapq
+import codecs
+import json
 import math
 import logging
 import re
@@ -9,27 +15,181 @@ from dateutil.parser import parse
 import pandas as pd
 import numpy as np
 
+from port.api.props import data_frame_to_json
+
 logger = logging.getLogger(__name__)
 
 REGEX_ISO8601_FULL = r"^(-?(?:[1-9][0-9]*)?[0-9]{4})-(1[0-2]|0[1-9])-(3[01]|0[1-9]|[12][0-9])T(2[0-3]|[01][0-9]):([0-5][0-9]):([0-5][0-9])(\.[0-9]+)?(Z|[+-](?:2[0-3]|[01][0-9]):[0-5][0-9])?$"
 REGEX_ISO8601_DATE = r"^(-?(?:[1-9][0-9]*)?[0-9]{4})-(1[0-2]|0[1-9])-(3[01]|0[1-9]|[12][0-9])$"
 
 
-def split_dataframe(df: pd.DataFrame, row_count: int) -> list[pd.DataFrame]:
+# Port has trouble putting large tables in memory, tables are split in chunks of roughly this size
+CHUNK_TARGET_BYTES = 25_000_000
+
+
+def estimate_row_bytes(df: pd.DataFrame, sample_size: int = 1000) -> float:
+    """
+    Estimates the number of bytes per row when df is serialized with props.data_frame_to_json
+    from rows sampled evenly over df
+    """
+    if df.empty:
+        return 0.0
+
+    step = max(1, len(df) // sample_size)
+    sample = df.iloc[::step]
+    return len(data_frame_to_json(sample.reset_index(drop=True))) / len(sample)
+
+
+def rows_per_chunk(df: pd.DataFrame, target_bytes: int = CHUNK_TARGET_BYTES) -> int:
     """
-    Port has trouble putting large tables in memory. 
-    Has to be expected. Solution split tables into smaller tables.
-    I have tried non-bespoke table soluions they did not perform any better
+    Number of rows of a chunk that is roughly target_bytes when serialized, estimated from the rows of df
+    df can be a sample (for example a preview) of the rows that are chunked
+    """
+    row_bytes = estimate_row_bytes(df)
+    return max(1, int(target_bytes // row_bytes)) if row_bytes > 0 else max(1, len(df))
+
+
+def iter_batches(items: Iterable[Any], batch_size: int) -> Iterator[list[Any]]:
+    """
+    Lazily yields consecutive lists of at most batch_size items
+    Only one batch is held in memory at a time
+    """
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
 
-    I hope you have an idea to make tables faster! Would be nice
+def skip_positions(items: Iterable[Any], positions: Iterable[int]) -> Iterator[Any]:
     """
-    # Calculate the number of splits needed.
-    num_splits = int(len(df) / row_count) + (len(df) % row_count > 0)
+    Lazily yields the items that are not at one of the given positions
+    """
+    skip = set(positions)
+    if not skip:
+        yield from items
+        return
 
-    # Split the DataFrame into chunks of size row_count.
-    df_splits = [df[i*row_count:(i+1)*row_count].reset_index(drop=True) for i in range(num_splits)]
+    for i, item in enumerate(items):
+        if i not in skip:
+            yield item
 
-    return df_splits
+
+class ReservoirSample:
+    """
+    Uniform sample of k items in one pass (reservoir sampling), the same seed gives the same sample
+    Items can be added in several calls of add(), the sample is the same as when they are added at once
+    """
+
+    def __init__(self, k: int, seed: int = 0) -> None:
+        self.k = k
+        self.total = 0
+        self._rng = random.Random(seed)
+        self._reservoir: list[tuple[int, Any]] = []
+
+    def add(self, items: Iterable[Any]) -> None:
+        k, rng, reservoir = self.k, self._rng, self._reservoir
+        total = self.total
+        for total, item in enumerate(items, start=self.total + 1):
+            if len(reservoir) < k:
+                reservoir.append((total - 1, item))
+            else:
+                j = rng.randrange(total)
+                if j < k:
+                    reservoir[j] = (total - 1, item)
+        self.total = total
+
+    def result(self) -> tuple[list[tuple[int, Any]], int]:
+        """
+        Returns the sampled (position, item) pairs ordered by position and the total number of items
+        """
+        return sorted(self._reservoir, key=lambda pair: pair[0]), self.total
+
+
+class NewestN:
+    """
+    The k items with the largest key (for example the newest timestamps) in one pass, ties go to the later item
+    Items can be added in several calls of add(), the result is the same as when they are added at once
+    """
+
+    def __init__(self, k: int, key: Callable[[Any], Any]) -> None:
+        self.k = k
+        self.key = key
+        self.total = 0
+        self._heap: list[tuple[Any, int, Any]] = []
+
+    def add(self, items: Iterable[Any]) -> None:
+        k, key, heap = self.k, self.key, self._heap
+        total = self.total
+        for total, item in enumerate(items, start=self.total + 1):
+            entry = (key(item), total - 1, item)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+        self.total = total
+
+    def result(self) -> tuple[list[tuple[int, Any]], int]:
+        """
+        Returns the (position, item) pairs ordered by position and the total number of items
+        """
+        return sorted(((position, item) for _, position, item in self._heap), key=lambda pair: pair[0]), self.total
+
+
+def reservoir_sample(items: Iterable[Any], k: int, seed: int = 0) -> tuple[list[tuple[int, Any]], int]:
+    """
+    Uniform sample of k items in one pass, see ReservoirSample
+    Returns the sampled (position, item) pairs ordered by position and the total number of items
+    """
+    sample = ReservoirSample(k, seed)
+    sample.add(items)
+    return sample.result()
+
+
+def newest_n(items: Iterable[Any], k: int, key: Callable[[Any], Any]) -> tuple[list[tuple[int, Any]], int]:
+    """
+    The k items with the largest key in one pass, see NewestN
+    Returns the (position, item) pairs ordered by position and the total number of items
+    """
+    newest = NewestN(k, key)
+    newest.add(items)
+    return newest.result()
+
+
+def preview_rows(
+    df: pd.DataFrame, k: int, mode: str = "newest", time_column: str | None = None, seed: int = 0
+) -> pd.DataFrame:
+    """
+    Returns a preview of at most k rows of df, rows keep their index
+
+    mode "newest": the k rows with the latest time_column ("YYYY-MM-DD HH:MM:SS" strings)
+    mode "sample": a uniform sample, the same seed gives the same sample
+    Without time_column (or if it is not in df) a sample is taken
+    """
+    if len(df) <= k:
+        return df
+
+    if mode == "newest" and time_column is not None and time_column in df.columns:
+        # stable sort, so ties go to the later row like newest_n
+        order = np.argsort(df[time_column].fillna("").to_numpy(dtype=str), kind="stable")
+        positions = np.sort(order[-k:])
+    else:
+        positions = np.sort(np.random.default_rng(seed).choice(len(df), size=k, replace=False))
+
+    return df.iloc[positions]
+
+
+def iter_encoded_batches(
+    key: str, columns: list[str], rows: Iterable[Iterable[Any]], batch_size: int
+) -> Iterator[str]:
+    """
+    Lazily yields rows as json strings of at most batch_size rows each
+    A batch is {f"{key}_{i}": table} with the table in the format of props.data_frame_to_json,
+    the format in which every table is donated (see props.PropsUIPromptConsentFormTable.donation_json)
+    """
+    for i, batch in enumerate(iter_batches(rows, batch_size)):
+        yield f"{{{json.dumps(f'{key}_{i}')}: {data_frame_to_json(pd.DataFrame(batch, columns=columns))}}}"
 
 
 class CannotConvertEpochTimestamp(Exception):
@@ -40,6 +200,9 @@ def is_timestamp(input_string: str) -> bool:
     """
     Detects if string is a timestamp
     relies on pandas.to_datetime() to detect the time format
+
+    Slow, only use on single values. For columns use infer_timestamp_format
+    or convert_timestamp_column
     """
     with warnings.catch_warnings():
         warnings.filterwarnings("error")  # temporary behaviour
@@ -74,44 +237,221 @@ def is_timestamp(input_string: str) -> bool:
 
 
 
+@dataclass(frozen=True)
+class TimestampFormat:
+    """
+    Format of a column with timestamps as learned by infer_timestamp_format
+
+    Attributes:
+        kind: one of "iso8601", "epoch_s", "epoch_ms", "strftime" or "unknown"
+        format: strftime format, only set when kind is "strftime"
+    """
+    kind: str
+    format: str | None = None
+
+
+TIMESTAMP_FORMAT_UNKNOWN = TimestampFormat("unknown")
+
+# Epoch timestamps (unit seconds) between the start of year 2000 and the year 2040
+EPOCH_MIN = 946684800
+EPOCH_MAX = 2208988800
+
+# Localized formats that are tried in order, month first is preferred over day first
+LOCALIZED_TIMESTAMP_FORMATS = [
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y/%m/%d %H:%M:%S",
+    "%m/%d/%Y %H:%M:%S",
+    "%m/%d/%Y %H:%M",
+    "%m/%d/%Y",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M",
+    "%d/%m/%Y",
+    "%d-%m-%Y %H:%M:%S",
+    "%d-%m-%Y %H:%M",
+    "%d-%m-%Y",
+    "%b %d, %Y, %I:%M:%S %p",
+    "%b %d, %Y %I:%M %p",
+    "%b %d, %Y",
+    "%d %b %Y, %H:%M",
+    "%d %b %Y %H:%M",
+    "%d %b %Y",
+]
+
+# Formats learned per column name
+_TIMESTAMP_FORMAT_CACHE: dict[str, TimestampFormat] = {}
+
+
+def _non_empty_strings(column: pd.Series) -> pd.Series:
+    column = column.dropna().astype(str).str.strip()
+    return column[column != ""]
+
+
+def infer_timestamp_format(column: pd.Series, sample_size: int = 50) -> TimestampFormat:
+    """
+    Infers the timestamp format of a column from a sample of its non-empty values
+
+    The first candidate format that matches every value in the sample is returned:
+    epoch seconds, epoch milliseconds, ISO 8601 and then LOCALIZED_TIMESTAMP_FORMATS
+    """
+    sample = _non_empty_strings(column.head(sample_size * 4)).head(sample_size)
+    if sample.empty:
+        return TIMESTAMP_FORMAT_UNKNOWN
+
+    if sample.str.fullmatch(r"-?[0-9]+").all():
+        # Longer digit strings are no epoch timestamps and would overflow int64
+        if (sample.str.len() > 16).any():
+            return TIMESTAMP_FORMAT_UNKNOWN
+        values = sample.astype("int64")
+        if values.between(EPOCH_MIN, EPOCH_MAX).all():
+            return TimestampFormat("epoch_s")
+        if values.between(EPOCH_MIN * 1000, EPOCH_MAX * 1000).all():
+            return TimestampFormat("epoch_ms")
+        return TIMESTAMP_FORMAT_UNKNOWN
+
+    if (sample.str.fullmatch(REGEX_ISO8601_FULL) | sample.str.fullmatch(REGEX_ISO8601_DATE)).all():
+        return TimestampFormat("iso8601")
+
+    for timestamp_format in LOCALIZED_TIMESTAMP_FORMATS:
+        parsed = pd.to_datetime(sample, format=timestamp_format, errors="coerce")
+        if parsed.notna().all():
+            return TimestampFormat("strftime", timestamp_format)
+
+    logger.debug("Could not infer timestamp format from: %s", sample.iloc[0])
+    return TIMESTAMP_FORMAT_UNKNOWN
+
+
+def _convert_with_format(column: pd.Series, timestamp_format: TimestampFormat) -> pd.Series:
+    if timestamp_format.kind in ("epoch_s", "epoch_ms"):
+        unit = "s" if timestamp_format.kind == "epoch_s" else "ms"
+        numbers = pd.to_numeric(column, errors="coerce")
+        return pd.to_datetime(numbers, unit=unit, utc=True, errors="coerce")
+
+    if timestamp_format.kind == "iso8601":
+        return pd.to_datetime(column, utc=True, errors="coerce")
+
+    if timestamp_format.kind == "strftime":
+        return pd.to_datetime(column, format=timestamp_format.format, utc=True, errors="coerce")
+
+    return pd.Series(pd.NaT, index=column.index, dtype="datetime64[ns, UTC]")
+
+
+def convert_timestamp_column(
+    column: pd.Series, cache_key: str | None = None, min_valid: float = 0.5
+) -> pd.Series:
+    """
+    Converts a column with timestamps to datetime64[ns, UTC] in one vectorized pass
+    Values that cannot be converted become NaT
+
+    The format is inferred from a sample (see infer_timestamp_format) and verified on the whole column.
+    If cache_key is given (for example the column name) the learned format is reused for later columns
+    with the same key. When less than min_valid of the non-empty values convert, the format is inferred again.
+    """
+    timestamp_format = _TIMESTAMP_FORMAT_CACHE.get(cache_key) if cache_key is not None else None
+    learned = timestamp_format is None
+    if timestamp_format is None:
+        timestamp_format = infer_timestamp_format(column)
+
+    converted = _convert_with_format(column, timestamp_format)
+
+    n_non_empty = len(_non_empty_strings(column))
+    if n_non_empty > 0 and converted.notna().sum() < min_valid * n_non_empty and not learned:
+        logger.debug("Cached timestamp format does not fit column: %s, inferring again", cache_key)
+        timestamp_format = infer_timestamp_format(column)
+        converted = _convert_with_format(column, timestamp_format)
+        learned = True
+
+    if cache_key is not None and learned and timestamp_format != TIMESTAMP_FORMAT_UNKNOWN:
+        _TIMESTAMP_FORMAT_CACHE[cache_key] = timestamp_format
+
+    return converted
+
+
+@dataclass
+class ValidationResult:
+    """
+    Result of validating every value in a column
+
+    Attributes:
+        mask: boolean array, True where the value is valid
+        n_valid: number of valid values
+        n_invalid: number of invalid values
+        first_invalid: position of the first invalid value, None if all values are valid
+    """
+    mask: np.ndarray
+    n_valid: int
+    n_invalid: int
+    first_invalid: int | None
+
+    @property
+    def all_valid(self) -> bool:
+        return self.n_invalid == 0
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray) -> "ValidationResult":
+        n_valid = int(mask.sum())
+        invalid_positions = np.flatnonzero(~mask)
+        first_invalid = int(invalid_positions[0]) if len(invalid_positions) > 0 else None
+        return cls(mask, n_valid, len(mask) - n_valid, first_invalid)
+
+
+def _fullmatch_strings(values: pd.Series, regex: str) -> pd.Series:
+    """
+    Vectorized re.fullmatch on the strings in values, results in NaN for values that are not strings
+    """
+    try:
+        return values.str.fullmatch(regex)
+    except AttributeError:
+        # .str is not available when values does not contain strings at all
+        return pd.Series(np.nan, index=values.index, dtype=object)
+
+
+def validate_isoformat(
+    datetime_str: list[str] | list[int] | np.ndarray | pd.Series, date_only: bool = False
+) -> ValidationResult:
+    """
+    Checks for every value in a list like object if it is an ISO 8601 string
+    date_only = True, checks if only the date part is ISO 8601
+
+    Values that are not strings are invalid
+    """
+    regex = REGEX_ISO8601_FULL if date_only is False else REGEX_ISO8601_DATE
+    values = pd.Series(datetime_str, dtype=object)
+    mask = _fullmatch_strings(values, regex).fillna(False).to_numpy(dtype=bool)
+    return ValidationResult.from_mask(mask)
+
+
+def validate_epoch(datetime_int: list[int] | list[str] | np.ndarray | pd.Series) -> ValidationResult:
+    """
+    Checks for every value in a list-like object with ints or str that can be interpreted as ints
+    if it is epoch time (unit seconds) between the start of year 2000 and the year 2040
+    """
+    values = pd.Series(datetime_int, dtype=object)
+
+    # strings should be integers, other values (ints, floats) are checked on their numeric value
+    is_str_int = _fullmatch_strings(values, r"\s*[+-]?[0-9]+\s*")
+    is_not_str = is_str_int.isna()
+    numbers = pd.to_numeric(values.where(is_not_str, values.astype(str).str.strip()), errors="coerce")
+
+    mask = (numbers.between(EPOCH_MIN, EPOCH_MAX) & (is_not_str | is_str_int.fillna(False))).to_numpy(dtype=bool)
+    return ValidationResult.from_mask(mask)
+
+
 def is_isoformat(
     datetime_str: list[str] | list[int], check_minimum: int, date_only: bool = False
 ) -> bool:
     """
     Check if list like object containing datetime stamps are ISO 8601 strings
     date_only = True, checks if only the date part is ISO 8601
-    """
-
-    regex = (
-        REGEX_ISO8601_FULL
-        if date_only is False
-        else REGEX_ISO8601_DATE
-    )
-
-    try:
-        for i in range(min(len(datetime_str), check_minimum)):
-            if isinstance(datetime_str[i], int):
-                logger.debug(
-                    "Could not detect ISO 8601 timestamp (date_only=%s): %s",
-                    date_only,
-                    datetime_str[i],
-                )
-                return False
-
-            if re.fullmatch(regex, datetime_str[i]) is None:  # type: ignore
-                logger.debug(
-                    "Could not detect ISO 8601 timestamp (date_only=%s): %s",
-                    date_only,
-                    datetime_str[i],
-                )
-                return False
 
-    except Exception as e:
+    Only the first check_minimum items are checked, use validate_isoformat to check all items
+    """
+    result = validate_isoformat(list(datetime_str[:check_minimum]), date_only)
+    if not result.all_valid:
         logger.debug(
-            "Could not detect ISO 8601 timestamp (date_only=%s): %s, error: %s",
+            "Could not detect ISO 8601 timestamp (date_only=%s): %s",
             date_only,
-            datetime_str[i],
-            e
+            datetime_str[result.first_invalid],  # type: ignore
         )
         return False
 
@@ -123,20 +463,12 @@ def is_epoch(datetime_int: list[int] | list[str], check_minimum: int) -> bool:
     """
     Check if list-like object with ints or str that can be interpreted as ints
     epoch time (unit seconds) fall between the start of year 2000 and the year 2040
-    """
-
-    year2000 = 946684800
-    year2040 = 2208988800
 
-    try:
-        for i in range(min(len(datetime_int), check_minimum)):
-            check_time = int(datetime_int[i])
-            if not year2000 <= check_time <= year2040:
-                logger.debug("Could not detect epoch time timestamp: %s", check_time)
-                return False
-
-    except Exception as e:
-        logger.debug("Could not detect epoch time timestamp, %s", e)
+    Only the first check_minimum items are checked, use validate_epoch to check all items
+    """
+    result = validate_epoch(list(datetime_int[:check_minimum]))
+    if not result.all_valid:
+        logger.debug("Could not detect epoch time timestamp: %s", datetime_int[result.first_invalid])  # type: ignore
         return False
 
     logger.debug("Epoch timestamp detected")
@@ -159,6 +491,75 @@ def epoch_to_iso(epoch_timestamp: str | int) -> str:
 
     return out
 
+# Range of datetime.fromtimestamp: 0001-01-01T00:00:00 up to and including 9999-12-31T23:59:59
+_DATETIME_MIN_EPOCH = -62135596800
+_DATETIME_MAX_EPOCH = 253402300799
+
+
+def epoch_to_iso_batch(
+    epoch_timestamps: list[str] | list[int] | np.ndarray | pd.Series,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Convert epoch timestamps to ISO 8601 strings. Assumes UTC.
+    Batch version of epoch_to_iso, the output strings are identical
+
+    Every distinct value is formatted only once, exports often contain many identical timestamps.
+
+    Returns the converted strings and a boolean mask that is True for inputs that could not be converted,
+    those are returned as str(input)
+    """
+    values = pd.Series(epoch_timestamps, dtype=None if len(epoch_timestamps) > 0 else object)
+
+    if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+        numbers = values
+        valid = numbers.between(_DATETIME_MIN_EPOCH, _DATETIME_MAX_EPOCH).to_numpy(dtype=bool)
+    else:
+        values = values.astype(object)
+        is_str_int = _fullmatch_strings(values, r"\s*[+-]?[0-9]+\s*")
+        is_not_str = is_str_int.isna()
+        numbers = pd.to_numeric(values.where(is_not_str, values.astype(str).str.strip()), errors="coerce")
+        valid = (
+            numbers.between(_DATETIME_MIN_EPOCH, _DATETIME_MAX_EPOCH)
+            & (is_not_str | is_str_int.fillna(False))
+        ).to_numpy(dtype=bool)
+
+    out = np.empty(len(values), dtype=object)
+    if valid.any():
+        seconds = numbers.to_numpy()[valid]
+        if seconds.dtype.kind == "f":
+            seconds = np.trunc(seconds)
+        unique_seconds, inverse = np.unique(seconds.astype("int64"), return_inverse=True)
+        unique_strings = np.datetime_as_string(unique_seconds.astype("datetime64[s]"), unit="s").tolist()
+        unique_iso = np.array([f"{iso}+00:00" for iso in unique_strings], dtype=object)
+        out[valid] = unique_iso[inverse]
+
+    invalid = ~valid
+    if invalid.any():
+        out[invalid] = values[invalid].astype(str).to_numpy(dtype=object)
+        logger.error("Could not convert %s epoch time timestamps", int(invalid.sum()))
+
+    return out, invalid
+
+
+def _denest_iterative(inp: Any, name: str = "") -> dict[Any, Any]:
+    """
+    Iterative depth first version of the dict_denester algorithm, no recursion limit
+    """
+    out: dict[Any, Any] = {}
+    stack: list[tuple[str, Any]] = [(name, inp)]
+
+    while stack:
+        prefix, item = stack.pop()
+        if isinstance(item, dict):
+            stack.extend((f"{prefix}-{k}", v) for k, v in reversed(item.items()))
+        elif isinstance(item, list):
+            stack.extend((f"{prefix}-{i}", v) for i, v in reversed(list(enumerate(item))))
+        else:
+            out[prefix[1:]] = item
+
+    return out
+
+
 def dict_denester(
     inp: dict[Any, Any] | list[Any],
     new: dict[Any, Any] | None = None,
@@ -169,26 +570,205 @@ def dict_denester(
     Denest a dict or list, returns a new denested dict
     """
 
-    if run_first:
+    if run_first or new is None:
         new = {}
 
-    if isinstance(inp, dict):
-        for k, v in inp.items():
-            if isinstance(v, (dict, list)):
-                dict_denester(v, new, f"{name}-{str(k)}", run_first=False)
+    new.update(_denest_iterative(inp, name))
+    return new
+
+
+class _IrregularRecord(Exception):
+    """Record does not have the shape of the learned record template"""
+
+
+@dataclass
+class _RecordTemplate:
+    """
+    Shape of a nested record
+
+    Attributes:
+        containers: (parent index, key, type, length) per dict or list, in depth first order
+        leaves: (parent index, key, column name) per leaf value, in dict_denester order
+        usable: False when two leaves map to the same column name, those records need the generic algorithm
+    """
+    containers: list[tuple[int, Any, type, int]]
+    leaves: list[tuple[int, Any, str]]
+    usable: bool = True
+
+    @classmethod
+    def learn(cls, record: dict[Any, Any] | list[Any]) -> "_RecordTemplate":
+        containers: list[tuple[int, Any, type, int]] = []
+        leaves: list[tuple[int, Any, str]] = []
+        stack: list[tuple[int, Any, str, Any]] = [(-1, None, "", record)]
+
+        while stack:
+            parent, key, prefix, item = stack.pop()
+            if isinstance(item, (dict, list)):
+                index = len(containers)
+                containers.append((parent, key, type(item), len(item)))
+                children = item.items() if isinstance(item, dict) else enumerate(item)
+                stack.extend((index, k, f"{prefix}-{k}", v) for k, v in reversed(list(children)))
             else:
-                newname = f"{name}-{k}"
-                new.update({newname[1:]: v})  # type: ignore
+                leaves.append((parent, key, prefix[1:]))
 
-    elif isinstance(inp, list):
-        for i, item in enumerate(inp):
-            dict_denester(item, new, f"{name}-{i}", run_first=False)
+        usable = len({name for _, _, name in leaves}) == len(leaves)
+        return cls(containers, leaves, usable)
 
-    else:
-        new.update({name[1:]: inp})  # type: ignore
+    def extract(self, record: Any) -> list[Any]:
+        """
+        Returns the leaf values of record in column order
+        Raises _IrregularRecord if record does not have the shape of this template
+        """
+        if not self.usable:
+            raise _IrregularRecord()
+
+        try:
+            fetched: list[Any] = []
+            for parent, key, container_type, length in self.containers:
+                item = record if parent < 0 else fetched[parent][key]
+                if type(item) is not container_type or len(item) != length:
+                    raise _IrregularRecord()
+                fetched.append(item)
+
+            values = [fetched[parent][key] for parent, key, _ in self.leaves]
+        except (KeyError, IndexError, TypeError) as e:
+            raise _IrregularRecord() from e
+
+        for value in values:
+            if isinstance(value, (dict, list)):
+                raise _IrregularRecord()
+
+        return values
+
+
+def denest_records(records: Iterable[dict[Any, Any]]) -> dict[str, list[Any]]:
+    """
+    Denests a list of (mostly) homogeneous records into columns
+    Column names are the keys dict_denester would create
+
+    The shape of the records is learned from the first record and reused for the records that follow,
+    records with a different shape are denested with the generic algorithm.
+    Missing values are None
+
+    Example:
+
+    denest_records([{"a": {"b": 1}}, {"a": {"b": 2}, "c": 3}])
+    returns {"a-b": [1, 2], "c": [None, 3]}
+    """
+    columns: dict[str, list[Any]] = {}
+    template: _RecordTemplate | None = None
+    template_columns: list[list[Any]] | None = None
+    n_regular = 0
+    n_irregular = 0
+    n_rows = 0
+
+    def get_column(name: str) -> list[Any]:
+        column = columns.get(name)
+        if column is None:
+            column = columns[name] = []
+        if len(column) < n_rows:
+            column.extend([None] * (n_rows - len(column)))
+        return column
+
+    for record in records:
+        if template is None and isinstance(record, (dict, list)):
+            template = _RecordTemplate.learn(record)
+            template_columns = None
+            n_regular, n_irregular = 0, 0
+
+        try:
+            if template is None:
+                raise _IrregularRecord()
+            values = template.extract(record)
+            if template_columns is None:
+                template_columns = [get_column(name) for _, _, name in template.leaves]
+            for column, value in zip(template_columns, values):
+                column.append(value)
+            n_regular += 1
+
+        except _IrregularRecord:
+            for name, value in _denest_iterative(record).items():
+                get_column(name).append(value)
+            template_columns = None
+            n_irregular += 1
+
+            # the records changed shape, learn the new shape
+            if n_irregular > n_regular and isinstance(record, (dict, list)):
+                template = _RecordTemplate.learn(record)
+                n_regular, n_irregular = 0, 0
+
+        n_rows += 1
+
+    for name in columns:
+        get_column(name)
+
+    return columns
+
+
+def denest_records_to_df(records: Iterable[dict[Any, Any]]) -> pd.DataFrame:
+    """
+    Denests a list of records (see denest_records) into a pd.DataFrame
+    """
+    return pd.DataFrame(denest_records(records))
+
+
+class DenestedKeyIndex:
+    """
+    Index over the keys of denested dicts that have the same shape (the same keys in the same order)
 
-    return new  # type: ignore
+    Answers "which key is the least nested key that matches key_to_match" (see find_items).
+    Every answer is cached, so repeated lookups for records with the same shape are constant time.
+    """
+
+    def __init__(self, keys: Iterable[str]):
+        self.keys = tuple(keys)
+        self._depths = [str(k).count("-") for k in self.keys]
+        self._matches: dict[str, Any] = {}
 
+    def find(self, key_to_match: str) -> Any | None:
+        """
+        Returns the least nested key that matches key_to_match, None if no key matches
+        In case of a tie the first key wins
+        """
+        try:
+            return self._matches[key_to_match]
+        except KeyError:
+            pass
+
+        pattern = re.compile(key_to_match)
+        out = None
+        depth = math.inf
+        for k, depth_current_match in zip(self.keys, self._depths):
+            if depth_current_match < depth and pattern.search(str(k)):
+                depth = depth_current_match
+                out = k
+
+        self._matches[key_to_match] = out
+        return out
+
+    def find_many(self, keys_to_match: Iterable[str]) -> dict[str, Any | None]:
+        """
+        Batch version of find
+        """
+        return {key_to_match: self.find(key_to_match) for key_to_match in keys_to_match}
+
+
+# Indices per record shape, cleared when it grows too large (very irregular input)
+_KEY_INDEX_CACHE: dict[tuple[Any, ...], DenestedKeyIndex] = {}
+_KEY_INDEX_CACHE_MAX_SIZE = 1024
+
+
+def key_index_for(d: dict[Any, Any]) -> DenestedKeyIndex:
+    """
+    Returns the (cached) DenestedKeyIndex for the shape of denested dict d
+    """
+    shape = tuple(d.keys())
+    index = _KEY_INDEX_CACHE.get(shape)
+    if index is None:
+        if len(_KEY_INDEX_CACHE) >= _KEY_INDEX_CACHE_MAX_SIZE:
+            _KEY_INDEX_CACHE.clear()
+        index = _KEY_INDEX_CACHE[shape] = DenestedKeyIndex(shape)
+    return index
 
 
 def find_items(d: dict[Any, Any],  key_to_match: str) -> str:
@@ -209,44 +789,96 @@ def find_items(d: dict[Any, Any],  key_to_match: str) -> str:
     returns 2
 
     This function is needed because your_posts_1.json contains a wide variety of nestedness per post
+    Lookups go through a DenestedKeyIndex that is shared by all dicts with the same keys
     """
     out = ""
-    pattern = r"{}".format(f"^.*{key_to_match}.*$")
-    depth = math.inf
 
     try:
-        for k, v in d.items():
-            if re.match(pattern, k):
-                depth_current_match = k.count("-")
-                if depth_current_match < depth:
-                    depth = depth_current_match
-                    out = str(v)
+        key = key_index_for(d).find(key_to_match)
+        if key is not None:
+            out = str(d[key])
     except Exception as e:
         logger.error("bork bork: %s", e)
 
     return out
 
 
+def find_items_many(d: dict[Any, Any], keys_to_match: Iterable[str]) -> dict[str, str]:
+    """
+    Batch version of find_items, returns the value for every key in keys_to_match
+    """
+    out = {key_to_match: "" for key_to_match in keys_to_match}
+
+    try:
+        for key_to_match, key in key_index_for(d).find_many(out).items():
+            if key is not None:
+                out[key_to_match] = str(d[key])
+    except Exception as e:
+        logger.error("bork bork: %s", e)
+
+    return out
+
+
+
+_REGEX_ISO8601_SORTABLE = (
+    r"[0-9]{4}-[0-9]{2}-[0-9]{2}"
+    r"(?:[T ][0-9]{2}(?::[0-9]{2}(?::[0-9]{2}(?:\.[0-9]{1,6})?)?)?(?:Z|[+-][0-9]{2}:[0-9]{2})?)?"
+)
+
 
 def sort_isotimestamp_empty_timestamp_last(timestamp_series: pd.Series) -> pd.Series:
     """
     Can be used as follows:
 
     df = df.sort_values(by="Date", key=sort_isotimestamp_empty_timestamp_last)
+
+    Newest timestamps come first. Empty values and values that are not timestamps come last.
+    The whole column is parsed at once, timezone naive timestamps are interpreted as UTC
     """
+    # only ISO 8601 strings (as accepted by datetime.fromisoformat) are timestamps, others become NaT
+    if pd.api.types.infer_dtype(timestamp_series, skipna=True) != "string":
+        is_str = timestamp_series.map(lambda timestamp: isinstance(timestamp, str)).astype(bool)
+        timestamp_series = timestamp_series.where(is_str)
+    is_iso = timestamp_series.str.fullmatch(_REGEX_ISO8601_SORTABLE).fillna(False).astype(bool)
+    timestamp_series = timestamp_series.where(is_iso)
 
-    def convert_timestamp(timestamp):
-        out = np.inf
-        try:
-            if isinstance(timestamp, str) and len(timestamp) > 0:
-                dt = datetime.fromisoformat(timestamp)
-                out = -dt.timestamp()
-        except Exception as e:
-            logger.debug("Cannot convert timestamp: %s", e)
+    parsed = pd.to_datetime(timestamp_series, errors="coerce", utc=True)
+    seconds = parsed.to_numpy(dtype="datetime64[ns]").astype("int64") / 1e9
 
-        return out
+    key = np.where(parsed.isna().to_numpy(), np.inf, -seconds)
+    return pd.Series(key, index=timestamp_series.index)
+
+
+def sort_by_isotimestamp_empty_timestamp_last(df: pd.DataFrame, column: str) -> pd.DataFrame:
+    """
+    Sorts df on column, newest timestamp first and empty timestamps last
+    The sort is skipped when df is already in that order (TikTok exports are newest first)
+    """
+    key = sort_isotimestamp_empty_timestamp_last(df[column]).to_numpy()
+
+    if len(key) < 2 or bool(np.all(key[:-1] <= key[1:])):
+        return df
 
-    return timestamp_series.apply(convert_timestamp)
+    return df.iloc[np.argsort(key, kind="stable")]
+
+
+
+def timestamp_histogram(timestamps: pd.Series, freq: str = "H") -> pd.DataFrame:
+    """
+    Counts the number of timestamps per time bucket (default: per hour)
+
+    All timestamps are parsed in one vectorized pass, timestamps that cannot be parsed are dropped.
+    Returns a DataFrame with the start of each bucket (named after the input series) and "Aantal"
+    """
+    name = timestamps.name if timestamps.name is not None else "Tijdstip"
+
+    parsed = convert_timestamp_column(timestamps, cache_key=str(name))
+    counts = parsed.dropna().dt.floor(freq).value_counts(sort=False).sort_index()
+
+    return pd.DataFrame({
+        name: counts.index.strftime("%Y-%m-%d %H:%M:%S"),
+        "Aantal": counts.to_numpy(),
+    })
 
 
 
@@ -284,6 +916,95 @@ def fix_ascii_string(input: str) -> str:
         return input
 
 
+# A UTF-8 lead byte followed by a continuation byte, decoded as latin1
+REGEX_LATIN1_MOJIBAKE = r"[\u00c2-\u00f4][\u0080-\u00bf]"
+
+
+def _encode_as_invalid_utf8(error: UnicodeEncodeError) -> tuple[bytes, int]:
+    """
+    Encoding error handler: characters that are not latin1 become 0xff, a byte that is never valid UTF-8
+    """
+    return b"\xff" * (error.end - error.start), error.end
+
+
+codecs.register_error("port_invalid_utf8", _encode_as_invalid_utf8)
+
+
+def _string_mask(column: pd.Series) -> pd.Series:
+    if pd.api.types.infer_dtype(column, skipna=False) == "string":
+        return pd.Series(True, index=column.index)
+    return column.map(lambda value: isinstance(value, str)).astype(bool)
+
+
+def fix_latin1_column(column: pd.Series, sample_size: int = 1000) -> tuple[pd.Series, int]:
+    """
+    Column version of fix_latin1_string, the result per cell is identical
+
+    A sample of the column decides whether latin1 mojibake is present at all, clean columns are returned as is.
+    Otherwise all cells are repaired in bulk: they are joined, encoded and decoded at once.
+    Cells that are not valid UTF-8 after encoding are left untouched.
+
+    Returns the repaired column and the number of repaired cells
+    """
+    is_string = _string_mask(column).to_numpy()
+    strings = column[is_string]
+    if strings.empty or not strings.head(sample_size).str.contains(REGEX_LATIN1_MOJIBAKE).any():
+        return column, 0
+
+    separator = "\x00"
+    originals = strings.to_list()
+    joined = separator.join(originals).encode("latin1", errors="port_invalid_utf8")
+    decoded = joined.decode("utf-8", errors="surrogateescape")
+    pieces = decoded.split(separator)
+
+    if len(pieces) != len(originals):
+        # a cell contained the separator, repair cell by cell
+        repaired = [fix_latin1_string(value) for value in originals]
+    else:
+        # surrogates mark invalid UTF-8, fix_latin1_string would return the original cell
+        ends = np.cumsum([len(piece) + 1 for piece in pieces])
+        invalid_positions = [m.start() for m in re.finditer("[\udc80-\udcff]", decoded)]
+        invalid_cells = np.unique(np.searchsorted(ends, invalid_positions, side="right"))
+        for i in invalid_cells:
+            pieces[i] = originals[i]
+        repaired = pieces
+
+    repaired_array = np.array(repaired, dtype=object)
+    changed = repaired_array != strings.to_numpy(dtype=object)
+    n_repaired = int(changed.sum())
+    if n_repaired == 0:
+        return column, 0
+
+    # positional, the index of column can have duplicate labels
+    out = column.copy()
+    out.iloc[np.flatnonzero(is_string)[changed]] = repaired_array[changed]
+
+    logger.debug("Repaired %s cells with latin1 mojibake", n_repaired)
+    return out, n_repaired
+
+
+def fix_ascii_column(column: pd.Series) -> tuple[pd.Series, int]:
+    """
+    Column version of fix_ascii_string, only cells with non ascii characters are touched
+
+    Returns the fixed column and the number of fixed cells
+    """
+    is_string = _string_mask(column).to_numpy()
+    strings = column[is_string]
+    if strings.empty:
+        return column, 0
+
+    is_affected = strings.str.contains(r"[^\x00-\x7f]").to_numpy(dtype=bool)
+    affected = strings[is_affected]
+    if affected.empty:
+        return column, 0
+
+    out = column.copy()
+    fixed = affected.str.encode("ascii", "ignore").str.decode("ascii")
+    out.iloc[np.flatnonzero(is_string)[is_affected]] = fixed.to_numpy()
+    return out, len(affected)
+
+
 def try_to_convert_any_timestamp_to_iso8601(timestamp: str) -> str:
     """
     WARNING 
@@ -302,6 +1023,92 @@ def try_to_convert_any_timestamp_to_iso8601(timestamp: str) -> str:
     return timestamp
 
 
+# Formats that give the same result as dateutil.parser.parse(dayfirst=False)
+# Day first numeric formats are left out on purpose: for those dateutil chooses MM/DD
+ANY_TIMESTAMP_FORMATS = [
+    "%Y-%m-%dT%H:%M:%S%z",
+    "%Y-%m-%dT%H:%M:%S.%f%z",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S.%f",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d",
+    "%m/%d/%Y %H:%M:%S",
+    "%m/%d/%Y %H:%M",
+    "%m/%d/%Y",
+    "%b %d, %Y, %I:%M:%S %p",
+    "%b %d, %Y %I:%M %p",
+    "%b %d, %Y",
+    "%d %b %Y, %H:%M",
+    "%d %b %Y %H:%M",
+    "%d %b %Y",
+]
+
+
+def _learn_timestamp_format(timestamps: list[str]) -> str | None:
+    """
+    Returns the format in ANY_TIMESTAMP_FORMATS that parses most of timestamps
+    """
+    best_format = None
+    best_count = 0
+
+    for timestamp_format in ANY_TIMESTAMP_FORMATS:
+        count = 0
+        for timestamp in timestamps:
+            try:
+                datetime.strptime(timestamp, timestamp_format)
+                count += 1
+            except ValueError:
+                pass
+
+        if count > best_count:
+            best_format, best_count = timestamp_format, count
+        if best_count == len(timestamps):
+            break
+
+    return best_format
+
+
+def convert_any_timestamps_to_iso8601(timestamps: Iterable[str], n_learn: int = 20) -> list[str]:
+    """
+    Batch version of try_to_convert_any_timestamp_to_iso8601, the results are identical
+
+    The format is learned once from the first n_learn distinct timestamps and applied with strptime,
+    every distinct timestamp is converted only once. Timestamps that do not fit the learned format
+    are converted with try_to_convert_any_timestamp_to_iso8601
+    """
+    timestamps = list(timestamps)
+    converted: dict[str, str] = {}
+
+    learn_sample = []
+    for timestamp in dict.fromkeys(timestamps):
+        if len(learn_sample) >= n_learn:
+            break
+        if isinstance(timestamp, str):
+            learn_sample.append(replace_months(timestamp))
+
+    timestamp_format = _learn_timestamp_format(learn_sample)
+    logger.debug("Learned timestamp format: %s", timestamp_format)
+
+    for timestamp in timestamps:
+        if timestamp in converted:
+            continue
+
+        out = None
+        if timestamp_format is not None and isinstance(timestamp, str):
+            try:
+                out = datetime.strptime(replace_months(timestamp), timestamp_format).isoformat()
+            except ValueError:
+                pass
+
+        if out is None:
+            out = try_to_convert_any_timestamp_to_iso8601(timestamp)
+
+        converted[timestamp] = out
+
+    return [converted[timestamp] for timestamp in timestamps]
+
+
 def replace_months(input_string):
 
     month_mapping = {
@@ -0,0 +1,213 @@
+"""
+Load test: runs many donation sessions at once on synthetic TikTok exports
+
+Every session drives the flow with port.harness in a pool of worker processes.
+Donations are written to a local sink (OUTPUT_DIR/donations/<session>/) instead of a backend.
+Reports sessions per second, bytes donated and the peak memory per session (tracemalloc)
+
+Usage: python -m port.loadtest OUTPUT_DIR [--sessions N] [--workers N] [--records N]
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+import statistics
+import tracemalloc
+import argparse
+import zipfile
+import logging
+import random
+import json
+import time
+import os
+import re
+
+import port.harness as harness
+import port.script as script
+
+logger = logging.getLogger(__name__)
+
+
+def _timestamps(rng: random.Random, n: int) -> list[str]:
+    start = datetime(2022, 1, 1)
+    seconds = sorted(rng.randrange(0, 2 * 365 * 24 * 3600) for _ in range(n))
+    return [(start + timedelta(seconds=s)).strftime("%Y-%m-%d %H:%M:%S") for s in seconds]
+
+
+def write_synthetic_export(path: str | Path, n_records: int, seed: int = 0) -> str:
+    """
+    Writes a TikTok zip with n_records records in the large activity files and a few in the others
+    The files have the layout the extractors in port.tiktok expect
+    """
+    rng = random.Random(seed)
+    n_small = max(1, n_records // 100)
+
+    def video() -> str:
+        return f"https://www.tiktokv.com/share/video/{rng.randrange(10**18, 10**19)}/"
+
+    files = {
+        "Activity/Browsing History.txt": "".join(
+            f"Date: {t}\nLink: {video()}\n\n" for t in _timestamps(rng, n_records)
+        ),
+        "Activity/Like List.txt": "".join(
+            f"Date: {t}\nLink: {video()}\n\n" for t in _timestamps(rng, n_records)
+        ),
+        "Activity/Searches.txt": "".join(
+            f"Date: {t}\nSearch Term: {rng.choice(['cats', 'dogs', 'recepten', 'voetbal'])}\n\n"
+            for t in _timestamps(rng, n_small)
+        ),
+        "Activity/Share History.txt": "".join(
+            f"Date: {t}\nShared Content: video\nLink: {video()}\nMethod: {rng.choice(['whatsapp', 'copy'])}\n\n"
+            for t in _timestamps(rng, n_small)
+        ),
+        "Activity/Follower.txt": "".join(
+            f"Date: {t}\nUsername: user{i}\n\n" for i, t in enumerate(_timestamps(rng, n_small))
+        ),
+        "Activity/Following.txt": "".join(
+            f"Date: {t}\nUsername: user{i}\n\n" for i, t in enumerate(_timestamps(rng, n_small))
+        ),
+        "Direct Messages/Direct Messages.txt": "".join(
+            f">>> Chat History with friend{c}:\n"
+            + "".join(
+                f"Date: {t}\nFrom: {rng.choice(['me', f'friend{c}'])}\nContent: bericht {i}\n\n"
+                for i, t in enumerate(_timestamps(rng, 10))
+            )
+            for c in range(n_small)
+        ),
+        "App Settings/Settings.txt": "Interests: Comedy|Food|Sports\n",
+    }
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, text in files.items():
+            zf.writestr(f"TikTok/{name}", text)
+
+    return str(path)
+
+
+class FileDonationSink:
+    """
+    Stores every donation of a session as a file in directory, in the order they were donated
+    """
+
+    def __init__(self, directory: str | Path) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.n_donations = 0
+        self.n_bytes = 0
+
+    def __call__(self, command: dict[str, Any]) -> None:
+        if command["__type__"] != "CommandSystemDonate":
+            return
+
+        data = command["json_string"].encode("utf-8")
+        name = re.sub(r"[^\w.-]", "_", command["key"])
+        (self.directory / f"{self.n_donations:04d}_{name}.json").write_bytes(data)
+
+        self.n_donations += 1
+        self.n_bytes += len(data)
+
+
+def run_session(zip_path: str, session_id: str, sink_dir: str) -> dict[str, Any]:
+    """
+    Runs one donation session on zip_path, returns its measurements
+    """
+    # every session in the browser starts with an empty log
+    script.LOG_STREAM.seek(0)
+    script.LOG_STREAM.truncate()
+
+    sink = FileDonationSink(Path(sink_dir) / session_id)
+    result: dict[str, Any] = {"session_id": session_id, "file": zip_path}
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        steps = harness.drive(harness.default_payloads(zip_path), session_id, on_command=sink)
+        result["n_steps"] = len(steps)
+    except Exception as e:
+        logger.error("Session %s failed: %s", session_id, e)
+        result["error"] = repr(e)
+    finally:
+        result["seconds"] = round(time.perf_counter() - start, 4)
+        result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    result["n_donations"] = sink.n_donations
+    result["donated_bytes"] = sink.n_bytes
+    return result
+
+
+def run(output_dir: str, n_sessions: int = 10, workers: int | None = None, n_records: int = 10000) -> dict[str, Any]:
+    """
+    Runs n_sessions sessions on their own synthetic export in a pool of workers (default: one per core)
+    Writes and returns the report
+    """
+    workers = workers or os.cpu_count() or 1
+    exports_dir = Path(output_dir) / "exports"
+    sink_dir = Path(output_dir) / "donations"
+    exports_dir.mkdir(parents=True, exist_ok=True)
+
+    zip_paths = [
+        write_synthetic_export(exports_dir / f"tiktok_{i}.zip", n_records, seed=i)
+        for i in range(n_sessions)
+    ]
+
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(run_session, zip_path, f"session{i}", str(sink_dir))
+            for i, zip_path in enumerate(zip_paths)
+        ]
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error("Worker failed: %s", e)
+                results.append({"error": repr(e)})
+    seconds = time.perf_counter() - start
+
+    completed = [result for result in results if "error" not in result]
+    peaks = [result["peak_bytes"] for result in completed]
+    report = {
+        "sessions": n_sessions,
+        "workers": workers,
+        "records": n_records,
+        "seconds": round(seconds, 4),
+        "sessions_per_second": round(len(completed) / seconds, 4) if seconds > 0 else None,
+        "n_failed": len(results) - len(completed),
+        "donated_bytes": sum(result.get("donated_bytes", 0) for result in results),
+        "peak_bytes_median": int(statistics.median(peaks)) if peaks else None,
+        "peak_bytes_max": max(peaks) if peaks else None,
+        "results": sorted(results, key=lambda result: result.get("session_id", "")),
+    }
+
+    report_path = Path(output_dir) / "report.json"
+    report_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return report
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run concurrent donation sessions on synthetic TikTok exports")
+    parser.add_argument("output_dir", help="directory for the exports, donations and report.json")
+    parser.add_argument("--sessions", type=int, default=10, help="number of sessions")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="number of worker processes (default: number of cores)"
+    )
+    parser.add_argument(
+        "--records", type=int, default=10000, help="records in the browsing history and like list of an export"
+    )
+    args = parser.parse_args(argv)
+
+    report = run(args.output_dir, args.sessions, args.workers, args.records)
+    print(
+        f"{report['sessions']} sessions ({report['n_failed']} failed) in {report['seconds']:.2f}s "
+        f"with {report['workers']} workers: {report['sessions_per_second']} sessions/s, "
+        f"{report['donated_bytes']} bytes donated, "
+        f"peak memory per session: median {report['peak_bytes_median']} max {report['peak_bytes_max']} bytes"
+    )
+    return 1 if report["n_failed"] > 0 else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
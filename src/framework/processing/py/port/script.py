@@ -1,13 +1,17 @@
+from dataclasses import dataclass, field
 import logging
 import json
 import io
-from typing import Tuple
+from typing import Callable, Generator, Iterable, Iterator, Tuple
 
 import pandas as pd
 
 import port.api.props as props
 import port.validate as validate
 import port.tiktok as tiktok
+import port.helpers as helpers
+import port.unzipddp as unzipddp
+from port.budget import Budget, Watchdog
 
 from port.api.commands import (CommandSystemDonate, CommandUIRender, CommandSystemExit)
 
@@ -22,6 +26,70 @@ logging.basicConfig(
 
 LOGGER = logging.getLogger("script")
 
+# When True, every conversation in Direct Messages.txt (including the messages)
+# is donated as its own chunk. Otherwise only the per conversation metadata is donated
+DONATE_DIRECT_MESSAGE_CONTENT = False
+
+# Tables with more rows are shown as a preview of this many rows, the full table is donated
+# "newest": the most recent rows, "sample": a uniform (deterministic) sample of the rows
+PREVIEW_ROWS = 10_000
+PREVIEW_MODE = "newest"
+
+# Streamed tables report their progress after about this many (uncompressed) bytes of their file
+PROGRESS_STEP_BYTES = 8 * 1024**2
+
+# Limits per table, see port.budget
+# A table that exceeds its budget stops and keeps the rows it has, the reason is logged
+EXTRACTION_BUDGET = Budget(max_seconds=120, max_input_bytes=256 * 1024**2, max_rows=2_000_000)
+
+# Donation mode per table
+# "rows": every row is donated
+# "aggregate": only the number of rows per hour is donated
+# Tables that are not listed are donated row by row
+DONATION_MODES = {
+    "tiktok_video_browsing_history": "rows",
+    "tiktok_like_list": "rows",
+    "tiktok_searches": "rows",
+    "tiktok_share_history": "rows",
+    "tiktok_follower": "aggregate",
+    "tiktok_following": "aggregate",
+}
+
+
+
+@dataclass(frozen=True)
+class StudyConfig:
+    """
+    Data a study needs, applied by the extractors while the files are parsed
+
+    Attributes:
+        start: only extract records at or after start, "YYYY-MM-DD HH:MM:SS" or a prefix of it
+        end: only extract records before end, same format as start
+        columns: columns to extract per table name, tables that are not listed keep all columns
+        tables: names of the tables to extract, None extracts the tables that are enabled in TIKTOK_TABLES
+    """
+
+    start: str | None = None
+    end: str | None = None
+    columns: dict[str, tuple[str, ...]] = field(default_factory=dict)
+    tables: tuple[str, ...] | None = None
+
+    def is_enabled(self, spec: "TableSpec") -> bool:
+        if self.tables is None:
+            return spec.enabled
+        return spec.name in self.tables
+
+    def record_filter(self, df_name: str) -> tiktok.RecordFilter:
+        columns = self.columns.get(df_name)
+        # aggregated tables only need their timestamps, the histogram replaces the columns
+        if is_aggregated(df_name):
+            columns = None
+        return tiktok.RecordFilter(self.start, self.end, columns)
+
+
+# For example StudyConfig(start="2023-01-01", columns={"tiktok_like_list": ("Tijdstip",)})
+STUDY_CONFIG = StudyConfig()
+
 
 def process(session_id):
     LOGGER.info("Starting the donation flow")
@@ -63,7 +131,10 @@ def process(session_id):
                     LOGGER.info("Payload for %s", platform_name)
                     yield donate_logs(f"{session_id}-{platform_name}-tracking")
 
-                    table_list, donation_dict = extraction_fun(file_result.value, validation)
+                    extraction = extraction_fun(file_result.value, validation)
+                    table_list, donation_dict = yield from render_extraction_progress(
+                        "Jouw TikTok gegevens verwerken", extraction
+                    )
                     break
 
                 # DDP is not recognized: Different status code
@@ -99,6 +170,7 @@ def process(session_id):
 
             if consent_result.__type__ == "PayloadJSON":
                 LOGGER.info("Data donated; %s", platform_name)
+                apply_consent_deletions(table_list, consent_result.value)
                 if donation_dict is not None:
                     yield from donate_dict(platform_name, donation_dict)
                 yield donate_logs(f"{session_id}-{platform_name}-tracking")
@@ -122,9 +194,6 @@ def process(session_id):
 
 
 
-def chunk_list(lst, n):
-    return [lst[i:i + n] for i in range(0, len(lst), n)]
-
 ##################################################################
 
 def assemble_tables_into_form(table_list: list[props.PropsUIPromptConsentFormTable]) -> props.PropsUIPromptConsentForm:
@@ -186,187 +255,451 @@ def create_empty_table(platform_name: str) -> props.PropsUIPromptConsentFormTabl
 ##################################################################
 # Extraction functions
 
-def split_dataframe(df, chunk_size):
-    chunks = []
-    num_chunks = len(df) // chunk_size + 1
-    for i in range(num_chunks):
-        print("CHUNK")
-        start = i * chunk_size
-        end = min((i + 1) * chunk_size, len(df))
-        chunks.append(df[start:end].reset_index(drop=True))
-    return chunks
+def is_aggregated(df_name: str) -> bool:
+    return DONATION_MODES.get(df_name, "rows") == "aggregate"
 
-"""
-"""
 
-def extract_tiktok(tiktok_file: str, validation) -> Tuple[list[props.PropsUIPromptConsentFormTable], dict]:
-    tables_to_render = []
-    donation_dict = {}
+def apply_donation_mode(df_name: str, df: pd.DataFrame, time_column: str = "Tijdstip") -> pd.DataFrame:
+    """
+    Returns the table as it should be shown and donated given its donation mode
+    In aggregate mode the rows are replaced by the number of rows per hour
+    """
+    if is_aggregated(df_name):
+        return helpers.timestamp_histogram(df[time_column])
+    return df
+
+
+def apply_consent_deletions(table_list: list[props.PropsUIPromptConsentFormTable], consent_json: str) -> None:
+    """
+    Deletes the rows the participant deleted in the consent form from the tables
+    The consent form returns {"deletedRows": {table_id: [row_id, ...]}, ...}
+    """
+    try:
+        deleted_rows = json.loads(consent_json).get("deletedRows", {})
+    except Exception as e:
+        LOGGER.error("Could not read the consent result: %s", e)
+        return
+
+    for table in table_list:
+        row_ids = deleted_rows.get(table.id)
+        if row_ids:
+            n_deleted = table.delete_rows(row_ids)
+            LOGGER.info("Participant deleted %s rows from table: %s", n_deleted, table.id)
+
+
+def add_table(
+    tables_to_render: list[props.PropsUIPromptConsentFormTable],
+    donation_dict: dict,
+    df_name: str,
+    table: props.PropsUIPromptConsentFormTable,
+    time_column: str = "Tijdstip",
+) -> None:
+    """
+    Adds a table to the consent form and to the donation
+
+    Tables with more than PREVIEW_ROWS rows are shown as a preview,
+    the full table (without the rows deleted in the preview) is donated.
+    Either way the table is donated once under df_name, whatever its size
+    """
+    tables_to_render.append(table)
+
+    df = table.data_frame
+    if len(df) <= PREVIEW_ROWS:
+        donation_dict[df_name] = table
+        return
 
-    df = tiktok.browsing_history_to_df(tiktok_file)
-    if not df.empty:
-        dfs = split_dataframe(df, 250000)
-        for i, df in enumerate(dfs):
-            df_name = f"tiktok_video_browsing_history_{i}"
-            hours_logged_in = {
-                "title": {"en": "Totaal aantal video's gekeken per maand", "nl": "Totaal aantal video's gekeken per maand"},
+    df = df.reset_index(drop=True)
+    table.data_frame = helpers.preview_rows(df, PREVIEW_ROWS, PREVIEW_MODE, time_column)
+    table.total_rows = len(df)
+
+    def full_table() -> props.PropsUIPromptConsentFormTable:
+        # the row ids of the preview are the positions in df
+        full = props.PropsUIPromptConsentFormTable(df_name, table.title, df)
+        full.delete_rows(table.deleted_row_ids)
+        return full
+
+    donation_dict[df_name] = full_table
+
+
+def _until_input_bytes(records: Iterator[tuple], watchdog: Watchdog, n_bytes: int) -> Iterator[tuple]:
+    for record in records:
+        yield record
+        if watchdog.input_bytes >= n_bytes:
+            return
+
+
+def preview_records(
+    records: Iterable[tuple], columns: list[str], watchdog: Watchdog, time_column: str = "Tijdstip"
+) -> Generator[int, None, tuple[pd.DataFrame, int]]:
+    """
+    Preview of at most PREVIEW_ROWS records in one pass, the index of a row is the position of its record
+    The records are taken in chunks of about PROGRESS_STEP_BYTES of the file (as read by watchdog),
+    after every chunk the number of bytes read is yielded
+    Returns the preview and the total number of records
+    """
+    if PREVIEW_MODE == "newest" and time_column in columns:
+        i = columns.index(time_column)
+        preview = helpers.NewestN(PREVIEW_ROWS, key=lambda record: record[i])
+    else:
+        preview = helpers.ReservoirSample(PREVIEW_ROWS)
+
+    records = iter(records)
+    while True:
+        n_records = preview.total
+        preview.add(_until_input_bytes(records, watchdog, watchdog.input_bytes + PROGRESS_STEP_BYTES))
+        if preview.total == n_records:
+            break
+        yield watchdog.input_bytes
+
+    pairs, total = preview.result()
+    index = pd.Index([position for position, _ in pairs], dtype="int64")
+    return pd.DataFrame([record for _, record in pairs], columns=columns, index=index), total
+
+
+def available_visualizations(df: pd.DataFrame, visualizations: list[dict]) -> list[dict] | None:
+    """
+    Returns the visualizations whose columns are in df (columns can be left out by the study config)
+    """
+    available = []
+    for visualization in visualizations:
+        columns = [visualization.get("group", {}).get("column"), visualization.get("textColumn")]
+        if all(column in df.columns for column in columns if column is not None):
+            available.append(visualization)
+    return available or None
+
+
+@dataclass(frozen=True)
+class TableSpec:
+    """
+    Describes a table that is extracted from the TikTok zip, see TIKTOK_TABLES
+
+    Attributes:
+        name: name of the table in the consent form and in the donation
+        source: file in the zip the table is extracted from
+        extract: extractor from tiktok.py, called with the zip, a tiktok.RecordFilter and a budget.Watchdog
+        columns: columns the extractor returns
+        title: title of the table
+        description: description of the table
+        visualizations: visualizations of the table, left out when their columns are not in the table
+        time_column: column with the timestamps (donation modes and previews)
+        stream: optional streaming extractor (same arguments as extract),
+            yields the records as tuples with the selected columns.
+            Streamed tables are never held as a whole, the table shows a preview
+        enabled: disabled tables are not extracted, their file is never read
+        budget: time and size limits of the extraction
+    """
+
+    name: str
+    source: str
+    extract: Callable[..., pd.DataFrame]
+    columns: tuple[str, ...]
+    title: props.Translatable
+    description: props.Translatable
+    visualizations: tuple[dict, ...] = ()
+    time_column: str = "Tijdstip"
+    stream: Callable[..., Iterator[tuple]] | None = None
+    enabled: bool = True
+    budget: Budget = EXTRACTION_BUDGET
+
+
+def _translatable(text: str) -> props.Translatable:
+    return props.Translatable({"en": text, "nl": text})
+
+
+def _donation_mode_description(df_name: str, text: str, rows: str, aggregate: str) -> props.Translatable:
+    """
+    Description of a table that ends with what is shown in its donation mode (see DONATION_MODES)
+    """
+    return _translatable(f"{text} {aggregate if is_aggregated(df_name) else rows}")
+
+
+TIKTOK_TABLES = [
+    TableSpec(
+        name="tiktok_video_browsing_history",
+        source="Browsing History.txt",
+        extract=tiktok.browsing_history_to_df,
+        stream=tiktok.iter_browsing_history,
+        columns=tuple(tiktok.BROWSING_HISTORY_COLUMNS),
+        title=_translatable("Kijkgeschiedenis"),
+        description=_translatable(
+            "De tabel hieronder geeft aan welke TikTok video's je precies hebt bekeken en wanneer dat was."
+            " De grafiek laat zien hoeveel video's je elke maand hebt bekeken."
+        ),
+        visualizations=(
+            {
+                "title": {
+                    "en": "Totaal aantal video's gekeken per maand",
+                    "nl": "Totaal aantal video's gekeken per maand",
+                },
                 "type": "area",
                 "group": {
                     "column": "Tijdstip",
                     "dateFormat": "month"
                 },
-                "values": [{
-                    "label": "Aantal"
-                }]
-            }
-            table_title = props.Translatable({"en": "Kijkgeschiedenis", "nl": "Kijkgeschiedenis"})
-            table_description = props.Translatable(
-                {
-                    "en": "De tabel hieronder geeft aan welke TikTok video's je precies hebt bekeken en wanneer dat was. De grafiek laat zien hoeveel video's je elke maand hebt bekeken. Heb je precies 250000 rijen in de tabel zitten? Dat konden we niet al je data laten zien in deze tabel. Ben je benieuwd naar de rest? Open de zipfile, ga naar 'Activity' en open 'Browsing history.txt'. Dan kun je zelf de rest bekijken. Lukt het niet? Laat het ons even weten via WhatsApp.",
-                    "nl": "De tabel hieronder geeft aan welke TikTok video's je precies hebt bekeken en wanneer dat was. De grafiek laat zien hoeveel video's je elke maand hebt bekeken. Heb je precies 250000 rijen in de tabel zitten? Dat konden we niet al je data laten zien in deze tabel. Ben je benieuwd naar de rest? Open de zipfile, ga naar 'Activity' en open 'Browsing history.txt'. Dan kun je zelf de rest bekijken. Lukt het niet? Laat het ons even weten via WhatsApp.",
-                 }
-            )
-            if i == 0:
-                table = props.PropsUIPromptConsentFormTable(df_name, table_title, df, table_description, [hours_logged_in]) 
-                tables_to_render.append(table)
-
-            donation_dict[df_name] = df.to_dict(orient="records")
-
-    df = tiktok.favorite_videos_to_df(tiktok_file)
-    if not df.empty:
-        df_name = "tiktok_favorite_videos"
-        table_title = props.Translatable(
+                "values": [{"label": "Aantal"}]
+            },
+        ),
+    ),
+    TableSpec(
+        name="tiktok_favorite_videos",
+        source="Favorite Videos.txt",
+        extract=tiktok.favorite_videos_to_df,
+        columns=("Tijdstip", "Video"),
+        title=_translatable("Favoriete video's"),
+        description=_translatable("In de tabel hieronder vind je de video's die tot je favorieten behoren."),
+    ),
+    TableSpec(
+        name="tiktok_favorite_hashtags",
+        source="Favorite HashTags.txt",
+        extract=tiktok.favorite_hashtag_to_df,
+        columns=("Tijdstip", "Hashtag url"),
+        title=_translatable("Favoriete hashtags"),
+        description=_translatable("In de tabel hieronder vind je de hashtags die tot je favorieten behoren."),
+    ),
+    TableSpec(
+        name="tiktok_hashtag",
+        source="Hashtag.txt",
+        extract=tiktok.hashtag_to_df,
+        columns=("Hashtag naam", "Hashtag url"),
+        title=_translatable("Hashtags in video's die je hebt geplaatst"),
+        description=_translatable(
+            "In de tabel hieronder vind je de hashtags die je gebruikt hebt "
+            "in een video die je hebt geplaats op TikTok."
+        ),
+    ),
+    TableSpec(
+        name="tiktok_like_list",
+        source="Like List.txt",
+        extract=tiktok.like_list_to_df,
+        columns=("Tijdstip", "Video"),
+        title=_translatable("Videos die je hebt geliket"),
+        description=_translatable("In de tabel hieronder vind je de video's die je hebt geliket en wanneer dat was."),
+    ),
+    TableSpec(
+        name="tiktok_searches",
+        source="Searches.txt",
+        extract=tiktok.searches_to_df,
+        columns=("Tijdstip", "Zoekterm"),
+        title=_translatable("Zoektermen"),
+        description=_translatable(
+            "De tabel hieronder laat zien wat je hebt gezocht en wanneer dat was. "
+            "De grootte van de woorden in de grafiek geeft aan hoe vaak de zoekterm voorkomt in jouw gegevens."
+        ),
+        visualizations=(
             {
-                "en": "Favoriete video's", 
-                "nl": "Favoriete video's", 
-            }
-        )
-        table_description = props.Translatable(
-            {
-                "nl": "In de tabel hieronder vind je de video's die tot je favorieten behoren.", 
-                "en": "In de tabel hieronder vind je de video's die tot je favorieten behoren.", 
-             }
-        )
-        table = props.PropsUIPromptConsentFormTable(df_name, table_title, df, table_description)
-        tables_to_render.append(table)
-        donation_dict[df_name] = df.to_dict(orient="records")
+                "title": {"en": "", "nl": ""},
+                "type": "wordcloud",
+                "textColumn": "Zoekterm",
+            },
+        ),
+    ),
+    TableSpec(
+        name="tiktok_share_history",
+        source="Share History.txt",
+        extract=tiktok.share_history_to_df,
+        columns=("Tijdstip", "Gedeelde inhoud", "Url", "Gedeeld via"),
+        title=_translatable("Gedeelde video's"),
+        description=_translatable(
+            "In de tabel hieronder vind je wat je hebt gedeeld, op welk tijdstip en de manier waarop."
+        ),
+    ),
+    TableSpec(
+        name="tiktok_follower",
+        source="Follower.txt",
+        extract=tiktok.follower_to_df,
+        columns=("Date",),
+        title=_translatable("Volgers"),
+        description=_donation_mode_description(
+            "tiktok_follower",
+            "In de tabel hieronder vind je wanneer mensen je zijn gaan volgen.",
+            rows="Je ziet niet wie, alleen wanneer elke nieuwe volger je is gaan volgen.",
+            aggregate="Je ziet niet wie, alleen hoeveel nieuwe volgers je per uur kreeg.",
+        ),
+        time_column="Date",
+    ),
+    TableSpec(
+        name="tiktok_following",
+        source="Following.txt",
+        extract=tiktok.following_to_df,
+        columns=("Date",),
+        title=_translatable("Accounts die je volgt"),
+        description=_donation_mode_description(
+            "tiktok_following",
+            "In de tabel hieronder vind je wanneer je andere accounts bent gaan volgen.",
+            rows="Je ziet niet wie, alleen wanneer je elk account bent gaan volgen.",
+            aggregate="Je ziet niet wie, alleen hoeveel accounts je per uur bent gaan volgen.",
+        ),
+        time_column="Date",
+    ),
+    TableSpec(
+        name="tiktok_direct_messages",
+        source="Direct Messages.txt",
+        extract=tiktok.direct_messages_to_df,
+        columns=(
+            "Gesprek met", "Aantal berichten", "Aantal verstuurd",
+            "Aantal ontvangen", "Eerste bericht", "Laatste bericht",
+        ),
+        title=_translatable("Privéberichten"),
+        description=_translatable(
+            "In de tabel hieronder vind je met wie je privéberichten hebt uitgewisseld, "
+            "hoeveel berichten dat waren en in welke periode. De inhoud van de berichten staat niet in de tabel."
+        ),
+    ),
+    TableSpec(
+        name="tiktok_settings",
+        source="Settings.txt",
+        extract=tiktok.settings_to_df,
+        columns=("Interesses",),
+        title=_translatable("Interesses op TikTok"),
+        description=_translatable(
+            "Hieronder vind je de interesses die je hebt aangevinkt bij het aanmaken van je TikTok account"
+        ),
+    ),
+]
+
+
+def aggregated_visualizations(visualizations: list[dict]) -> list[dict]:
+    """
+    Aggregated tables have a row per hour, the visualizations sum the "Aantal" column instead of counting rows
+    """
+    out = []
+    for visualization in visualizations:
+        if "values" in visualization:
+            values = [{**value, "column": "Aantal", "aggregate": "sum"} for value in visualization["values"]]
+            visualization = {**visualization, "values": values}
+        out.append(visualization)
+    return out
+
+
+def extract_table(
+    tables_to_render: list[props.PropsUIPromptConsentFormTable],
+    donation_dict: dict,
+    spec: TableSpec,
+    tiktok_file: str,
+    study_config: StudyConfig,
+) -> Generator[int, None, None]:
+    """
+    Extracts the table of spec from the zip and adds it to the consent form and to the donation
+    Empty tables are left out
+    While a streamed table is parsed the number of bytes of its file read so far is yielded (see preview_records)
+    """
+    record_filter = study_config.record_filter(spec.name)
+    aggregated = is_aggregated(spec.name)
+    streamed = spec.stream is not None and not aggregated
+    watchdog = Watchdog(spec.name, spec.budget)
+
+    total_rows = None
+    columns = record_filter.select(list(spec.columns))
+    if streamed:
+        records = spec.stream(tiktok_file, record_filter, watchdog)
+        df, total_rows = yield from preview_records(records, columns, watchdog, spec.time_column)
+    else:
+        df = spec.extract(tiktok_file, record_filter, watchdog)
+        if not df.empty:
+            df = apply_donation_mode(spec.name, df, time_column=spec.time_column)
+
+    LOGGER.info("Extracted %s", watchdog.metrics())
+    if df.empty:
+        return
+
+    visualizations = list(spec.visualizations)
+    if aggregated:
+        visualizations = aggregated_visualizations(visualizations)
+
+    table = props.PropsUIPromptConsentFormTable(
+        spec.name,
+        spec.title,
+        df,
+        spec.description,
+        available_visualizations(df, visualizations),
+    )
 
+    if not streamed:
+        add_table(tables_to_render, donation_dict, spec.name, table, time_column=spec.time_column)
+        describe_preview(table, spec.source)
+        return
+
+    # Streamed tables show a preview (see preview_records),
+    # the donation parses the file again and encodes and donates it batch by batch,
+    # the size of a batch is estimated from the preview (see helpers.CHUNK_TARGET_BYTES)
+    if total_rows is not None and total_rows > len(df):
+        table.total_rows = total_rows
+        describe_preview(table, spec.source)
+    tables_to_render.append(table)
+
+    # the row ids of the preview are positions in the stream
+    batch_size = helpers.rows_per_chunk(df)
+    donation_dict[spec.name] = lambda: helpers.iter_encoded_batches(
+        spec.name,
+        columns,
+        helpers.skip_positions(
+            spec.stream(tiktok_file, record_filter, donation_watchdog(spec, total_rows)), table.deleted_row_ids
+        ),
+        batch_size,
+    )
 
-    df = tiktok.favorite_hashtag_to_df(tiktok_file)
-    if not df.empty:
-        df_name = "tiktok_favorite_hashtags"
-        table_title = props.Translatable(
-            {
-                "en": "Favoriete hashtags", 
-                "nl": "Favoriete hashtags", 
-            }
-        )
-        table_description = props.Translatable(
-            {
-                "en": "In de tabel hieronder vind je de hashtags die tot je favorieten behoren.", 
-                "nl": "In de tabel hieronder vind je de hashtags die tot je favorieten behoren.", 
-             }
-        )
-        table = props.PropsUIPromptConsentFormTable(df_name, table_title, df, table_description)
-        tables_to_render.append(table)
-        donation_dict[df_name] = df.to_dict(orient="records")
-
-    df = tiktok.hashtag_to_df(tiktok_file)
-    if not df.empty:
-        df_name = "tiktok_hashtag"
-        table_title = props.Translatable(
-            {
-                "en": "Hashtags in video's die je hebt geplaatst", 
-                "nl": "Hashtags in video's die je hebt geplaatst", 
-            }
-        )
-        table_description = props.Translatable(
-            {
-                "nl": "In de tabel hieronder vind je de hashtags die je gebruikt hebt in een video die je hebt geplaats op TikTok.",
-                "en": "In de tabel hieronder vind je de hashtags die je gebruikt hebt in een video die je hebt geplaats op TikTok.",
-             }
-        )
-        table = props.PropsUIPromptConsentFormTable(df_name, table_title, df, table_description)
-        tables_to_render.append(table)
-        donation_dict[df_name] = df.to_dict(orient="records")
-
-    df = tiktok.like_list_to_df(tiktok_file)
-    if not df.empty:
-        df_name = "tiktok_like_list"
-        table_title = props.Translatable(
-            {
-                "en": "Videos die je hebt geliket", 
-                "nl": "Videos die je hebt geliket", 
-            }
-        )
-        table_description = props.Translatable(
-            {
-                "nl": "In de tabel hieronder vind je de video's die je hebt geliket en wanneer dat was.",
-                "en": "In de tabel hieronder vind je de video's die je hebt geliket en wanneer dat was.",
-             }
-        )
-        table =  props.PropsUIPromptConsentFormTable(df_name, table_title, df, table_description)
-        tables_to_render.append(table)
-        donation_dict[df_name] = df.to_dict(orient="records")
-
-
-    df = tiktok.searches_to_df(tiktok_file)
-    if not df.empty:
-        df_name = "tiktok_searches"
-        wordcloud = {
-            "title": {"en": "", "nl": ""},
-            "type": "wordcloud",
-            "textColumn": "Zoekterm",
-        }
-        table_title = props.Translatable(
-            {
-                "en": "Zoektermen", 
-                "nl": "Zoektermen", 
-            }
-        )
-        table_description = props.Translatable(
-            {
-                "nl": "De tabel hieronder laat zien wat je hebt gezocht en wanneer dat was. De grootte van de woorden in de grafiek geeft aan hoe vaak de zoekterm voorkomt in jouw gegevens.",
-                "en": "De tabel hieronder laat zien wat je hebt gezocht en wanneer dat was. De grootte van de woorden in de grafiek geeft aan hoe vaak de zoekterm voorkomt in jouw gegevens.",
-             }
-        )
-        table =  props.PropsUIPromptConsentFormTable(df_name, table_title, df, table_description, [wordcloud])
-        tables_to_render.append(table)
-        donation_dict[df_name] = df.to_dict(orient="records")
-
-    df = tiktok.share_history_to_df(tiktok_file)
-    if not df.empty:
-        df_name = "tiktok_share_history"
-        table_title = props.Translatable(
-            {
-                "en": "Gedeelde video's", 
-                "nl": "Gedeelde video's", 
-            }
-        )
-        table_description = props.Translatable(
-            {
-                "nl": "In de tabel hieronder vind je wat je hebt gedeeld, op welk tijdstip en de manier waarop.",
-                "en": "In de tabel hieronder vind je wat je hebt gedeeld, op welk tijdstip en de manier waarop.",
-             }
-        )
-        table =  props.PropsUIPromptConsentFormTable(df_name, table_title, df, table_description)
-        tables_to_render.append(table)
-        donation_dict[df_name] = df.to_dict(orient="records")
 
+def describe_preview(table: props.PropsUIPromptConsentFormTable, source: str) -> None:
+    """
+    Tells in the description of a table that is shown as a preview how many of its rows are shown
+    """
+    if table.total_rows is None or table.total_rows <= len(table.data_frame):
+        return
 
-    df = tiktok.settings_to_df(tiktok_file)
-    if not df.empty:
-        df_name = "tiktok_settings"
-        table_title = props.Translatable({"en": "Interesses op TikTok", "nl": "Interesses op TikTok"})
-        table_description = props.Translatable(
-            {
-                "nl": "Hieronder vind je de interesses die je hebt aangevinkt bij het aanmaken van je TikTok account",
-                "en": "Hieronder vind je de interesses die je hebt aangevinkt bij het aanmaken van je TikTok account",
-             }
+    note = (
+        f" De tabel laat {len(table.data_frame)} van de {table.total_rows} rijen zien, meer konden we niet laten zien."
+        f" Ben je benieuwd naar de rest? Open dan '{source}' in de zipfile."
+        " Dan kun je zelf de rest bekijken. Lukt het niet? Laat het ons even weten via WhatsApp."
+    )
+    translations = {language: text + note for language, text in table.description.translations.items()}
+    table.description = props.Translatable(translations)
+
+
+def donation_watchdog(spec: TableSpec, n_rows: int) -> Watchdog:
+    """
+    Watchdog for parsing a table again for its donation: the rows that were shown and no more,
+    also when the first parse stopped on the time budget
+    """
+    return Watchdog(spec.name, Budget(max_input_bytes=spec.budget.max_input_bytes, max_rows=n_rows))
+
+
+def extract_tiktok(
+    tiktok_file: str, validation, study_config: StudyConfig = STUDY_CONFIG
+) -> Generator[float, None, Tuple[list[props.PropsUIPromptConsentFormTable], dict]]:
+    """
+    Extracts the tables one by one, after every table (and while a streamed table is parsed)
+    the progress (0 to 1) is yielded.
+    The progress is the part of the (uncompressed) bytes of the source files that has been processed
+    Returns the tables to render and the donation (see donate_dict)
+    """
+    tables_to_render = []
+    donation_dict = {}
+
+    # tables that are not enabled are skipped before their file is read
+    specs = [spec for spec in TIKTOK_TABLES if study_config.is_enabled(spec)]
+    sizes = unzipddp.member_sizes(tiktok_file)
+    total_bytes = sum(sizes.get(spec.source, 0) for spec in specs)
+    processed_bytes = 0
+
+    yield 0.0
+    for i, spec in enumerate(specs):
+        size = sizes.get(spec.source, 0)
+        for n_read in extract_table(tables_to_render, donation_dict, spec, tiktok_file, study_config):
+            if total_bytes > 0:
+                yield (processed_bytes + min(n_read, size)) / total_bytes
+        processed_bytes += size
+        yield processed_bytes / total_bytes if total_bytes > 0 else (i + 1) / len(specs)
+
+    spec = next((spec for spec in specs if spec.name == "tiktok_direct_messages"), None)
+    table = next((table for table in tables_to_render if spec is not None and table.id == spec.name), None)
+    if spec is not None and table is not None and DONATE_DIRECT_MESSAGE_CONTENT:
+        # conversations deleted from the table are not donated
+        record_filter = study_config.record_filter(spec.name)
+        n_rows = table.total_rows or len(table.data_frame)
+        donation_dict["tiktok_direct_messages_conversation"] = lambda: helpers.skip_positions(
+            tiktok.direct_messages_per_conversation(tiktok_file, True, record_filter, donation_watchdog(spec, n_rows)),
+            table.deleted_row_ids,
         )
-        table =  props.PropsUIPromptConsentFormTable(df_name, table_title, df, table_description)
-        tables_to_render.append(table)
-        donation_dict[df_name] = df.to_dict(orient="records")
 
     return (tables_to_render, donation_dict)
 
@@ -378,13 +711,37 @@ def render_end_page():
     return CommandUIRender(page)
 
 
-def render_donation_page(platform, body):
+def render_donation_page(platform, body, progress_percentage=None):
     header = props.PropsUIHeader(props.Translatable({"en": platform, "nl": platform}))
-    footer = props.PropsUIFooter()
+    footer = props.PropsUIFooter(progress_percentage)
     page = props.PropsUIPageDonation(platform, header, body, footer)
     return CommandUIRender(page)
 
 
+def render_progress_page(platform, progress):
+    description = props.Translatable({
+        "en": "Je gegevens worden verwerkt. Dit kan even duren, sluit deze pagina niet.",
+        "nl": "Je gegevens worden verwerkt. Dit kan even duren, sluit deze pagina niet."
+    })
+    percentage = round(progress * 100)
+    body = props.PropsUIPromptProgress(description, f"{percentage}%")
+    return render_donation_page(platform, body, percentage)
+
+
+def render_extraction_progress(platform, extraction):
+    """
+    Runs an extraction that yields its progress (see extract_tiktok) and shows the progress after every step
+    The progress page resolves itself, its payload is ignored
+    Returns the result of the extraction
+    """
+    while True:
+        try:
+            progress = next(extraction)
+        except StopIteration as stop:
+            return stop.value
+        yield render_progress_page(platform, progress)
+
+
 def retry_confirmation(platform):
     text = props.Translatable(
         {
@@ -420,9 +777,30 @@ def donate_status(filename: str, message: str):
 
 
 def donate_dict(platform_name: str, d: dict):
+    """
+    Donates every item in d
+
+    Values can be tables, those are donated in the encoding that was used to render them
+    (see props.PropsUIPromptConsentFormTable.donation_json).
+    Values can be callables that return a table, the table is created and donated when it is its turn.
+    Values can be callables that return an iterator of chunks,
+    those are donated lazily, one donation per chunk, the key of chunk i ends with _{i}.
+    Chunks that are strings are already encoded (see helpers.iter_encoded_batches)
+    """
     for k, v in d.items():
-        donation_str = json.dumps({k: v})
-        yield donate(f"{platform_name}_{k}", donation_str)
+        if isinstance(v, props.PropsUIPromptConsentFormTable):
+            yield donate(f"{platform_name}_{k}", v.donation_json(k))
+        elif callable(v):
+            chunks = v()
+            if isinstance(chunks, props.PropsUIPromptConsentFormTable):
+                yield donate(f"{platform_name}_{k}", chunks.donation_json(k))
+                continue
+            for i, chunk in enumerate(chunks):
+                donation_str = chunk if isinstance(chunk, str) else json.dumps({k: chunk})
+                yield donate(f"{platform_name}_{k}_{i}", donation_str)
+        else:
+            donation_str = json.dumps({k: v})
+            yield donate(f"{platform_name}_{k}", donation_str)
 
 ###############################################################################################
 # Questionnaire questions
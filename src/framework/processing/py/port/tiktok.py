@@ -2,16 +2,18 @@
 DDP tiktok module
 """
 
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Any, Iterable, Iterator
 import logging
 import zipfile
 import re
 import io
-import json
 
 import pandas as pd
 
 import port.unzipddp as unzipddp
+from port.budget import Watchdog
 from port.validate import (
     DDPCategory,
     StatusCode,
@@ -108,78 +110,92 @@ def validate(file: Path) -> ValidateInput:
 
 
 
-def browsing_history_to_df(tiktok_zip: str):
-
-    out = pd.DataFrame()
-
-    try:
-        b = unzipddp.extract_file_from_zip(tiktok_zip, "Browsing History.txt")
-        b = io.TextIOWrapper(b, encoding='utf-8')
-        text = b.read()
-
-        pattern = re.compile(r"^Date: (.*?)\nLink: (.*?)$", re.MULTILINE)
-        matches = re.findall(pattern, text)
-        out = pd.DataFrame(matches, columns=["Tijdstip", "Gekeken video"])
-        out = out.drop_duplicates()
-        out.reset_index(drop=True, inplace=True)
-
-    except Exception as e:
-        logger.error(e)
-
-    return out
-
-
-def chunk_list(lst, n):
-    return [lst[i:i + n] for i in range(0, len(lst), n)]
-
-
-def browsing_history_to_df_e(tiktok_zip: str) -> list[str]:
+@dataclass(frozen=True)
+class RecordFilter:
+    """
+    Filters that extractors apply while records are parsed,
+    records and fields that are filtered out are never created
 
-    out = []
+    Attributes:
+        start: keep records at or after start, "YYYY-MM-DD HH:MM:SS" or a prefix of it (e.g. "2023-01-01")
+        end: keep records before end, same format as start
+        columns: columns to keep, None keeps all columns
 
-    try:
-        b = unzipddp.extract_file_from_zip(tiktok_zip, "Browsing History.txt")
-        b = io.TextIOWrapper(b, encoding='utf-8')
-        text = b.read()
+    Timestamps are compared as strings, which orders "YYYY-MM-DD HH:MM:SS" timestamps correctly.
+    Tables without a timestamp column are not filtered on time
+    """
 
-        pattern = re.compile(r"^Date: (.*?)\nLink: (.*?)$", re.MULTILINE)
-        matches = re.findall(pattern, text)
+    start: str | None = None
+    end: str | None = None
+    columns: tuple[str, ...] | None = None
 
-        time_d = {}
-        video_d = {}
-        chunks = chunk_list(matches, 250000)
-        for chunk in chunks:
-            for index, value in enumerate(chunk):
-                time, video_watched = value
-                time_d[str(index)] = time
-                video_d[str(index)] = video_watched
+    @property
+    def has_time_range(self) -> bool:
+        return self.start is not None or self.end is not None
 
-            res = {
-                "Tijdstip": time_d,
-                "Gekeken video": video_d
-            }
-            out.append(json.dumps(res))
+    def keep_time(self, timestamp: str) -> bool:
+        if self.start is not None and timestamp < self.start:
+            return False
+        if self.end is not None and timestamp >= self.end:
+            return False
+        return True
 
-    except Exception as e:
-        logger.error(e)
+    def select(self, columns: list[str]) -> list[str]:
+        if self.columns is None:
+            return list(columns)
+        return [column for column in columns if column in self.columns]
 
-    return out
 
+NO_FILTER = RecordFilter()
 
 
+def _extract_records(
+    tiktok_zip: str,
+    file_name: str,
+    pattern: re.Pattern,
+    columns: list[str],
+    time_column: str | None = None,
+    record_filter: RecordFilter = NO_FILTER,
+    watchdog: Watchdog | None = None,
+) -> pd.DataFrame:
+    """
+    Extracts a table from file_name in the zip, every match of pattern is a row
+    and the groups of pattern are the columns
 
-def favorite_hashtag_to_df(tiktok_zip: str):
+    record_filter is applied per match: matches outside the time range (on time_column) are skipped
+    and only the groups of the selected columns are read
+    watchdog: only the input budget of the file is read, parsing stops when the time or row budget is exceeded
+    """
 
     out = pd.DataFrame()
+    watchdog = watchdog or Watchdog(file_name)
 
     try:
-        b = unzipddp.extract_file_from_zip(tiktok_zip, "Favorite HashTags.txt")
-        b = io.TextIOWrapper(b, encoding='utf-8')
+        b = unzipddp.extract_file_from_zip(tiktok_zip, file_name, watchdog.budget.read_size())
+        b = io.TextIOWrapper(io.BytesIO(watchdog.limit_input(b.getvalue())), encoding='utf-8')
         text = b.read()
 
-        pattern = re.compile(r"^Date: (.*?)\nHashTag Link(?::|::) (.*?)$", re.MULTILINE)
-        matches = re.findall(pattern, text)
-        out = pd.DataFrame(matches, columns=["Tijdstip", "Hashtag url"])
+        selected = record_filter.select(columns)
+        groups = [columns.index(column) + 1 for column in selected]
+        time_group = None
+        if time_column is not None and record_filter.has_time_range:
+            time_group = columns.index(time_column) + 1
+
+        data: dict[str, list[str]] = {column: [] for column in selected}
+        appends = [data[column].append for column in selected]
+        n_rows = 0
+        for match in pattern.finditer(text):
+            if time_group is not None and not record_filter.keep_time(match.group(time_group)):
+                if not watchdog.ok():
+                    break
+                continue
+            if not watchdog.ok(rows=n_rows + 1):
+                break
+            for append, group in zip(appends, groups):
+                append(match.group(group))
+            n_rows += 1
+
+        out = pd.DataFrame(data, columns=selected)
 
     except Exception as e:
         logger.error(e)
@@ -187,98 +203,156 @@ def favorite_hashtag_to_df(tiktok_zip: str):
     return out
 
 
+BROWSING_HISTORY_COLUMNS = ["Tijdstip", "Gekeken video"]
 
-def favorite_videos_to_df(tiktok_zip: str):
-
-    out = pd.DataFrame()
 
-    try:
-        b = unzipddp.extract_file_from_zip(tiktok_zip, "Favorite Videos.txt")
-        b = io.TextIOWrapper(b, encoding='utf-8')
-        text = b.read()
+def parse_browsing_history(
+    lines: Iterable[str], record_filter: RecordFilter = NO_FILTER, watchdog: Watchdog | None = None
+) -> Iterator[tuple[str, ...]]:
+    """
+    Lazily yields a record for every "Date: " line that is directly followed by a "Link: " line
+    Records are tuples with the columns record_filter.select(BROWSING_HISTORY_COLUMNS)
+    Duplicate records are skipped, stops when the row budget of the watchdog is reached
+    (the time and input budget are watched by unzipddp.iter_lines_from_zip)
+
+    Duplicates are found by the hash of the record: seen keeps an int per record instead of the strings,
+    several times less memory. Still one entry per record (at most the row budget), and a distinct record
+    with the hash of an earlier one (chance about n**2 / 2**64) would be skipped.
+    The hash is the same in the preview and the donation parse, they run in the same process
+    """
+    seen: set[int] = set()
+    date = None
 
-        pattern = re.compile(r"^Date: (.*?)\nLink: (.*?)$", re.MULTILINE)
-        matches = re.findall(pattern, text)
-        out = pd.DataFrame(matches, columns=["Tijdstip", "Video"])
+    selected = record_filter.select(BROWSING_HISTORY_COLUMNS)
+    positions = [BROWSING_HISTORY_COLUMNS.index(column) for column in selected]
+    filter_time = record_filter.has_time_range
+    max_rows = watchdog.budget.max_rows if watchdog is not None else None
 
+    try:
+        for line in lines:
+            line = line.rstrip("\n")
+            if line.startswith("Link: ") and date is not None:
+                if filter_time and not record_filter.keep_time(date):
+                    date = None
+                    continue
+                record = (date, line[6:])
+                record_hash = hash(record)
+                if record_hash not in seen:
+                    # asking the watchdog per record is too slow for this file, only ask at the row budget
+                    if watchdog is not None and max_rows is not None and len(seen) >= max_rows:
+                        watchdog.ok(rows=len(seen) + 1)
+                        return
+                    seen.add(record_hash)
+                    yield tuple(record[i] for i in positions)
+            date = line[6:] if line.startswith("Date: ") else None
+    finally:
+        if watchdog is not None:
+            watchdog.rows = len(seen)
+
+
+def iter_browsing_history(
+    tiktok_zip: str, record_filter: RecordFilter = NO_FILTER, watchdog: Watchdog | None = None
+) -> Iterator[tuple[str, ...]]:
+    """
+    Lazily yields the records of Browsing History.txt while the file is decompressed
+    Records are tuples with the columns record_filter.select(BROWSING_HISTORY_COLUMNS)
+    """
+    try:
+        lines = unzipddp.iter_lines_from_zip(tiktok_zip, "Browsing History.txt", watchdog=watchdog)
+        yield from parse_browsing_history(lines, record_filter, watchdog)
     except Exception as e:
         logger.error(e)
 
-    return out
-
 
-
-def follower_to_df(tiktok_zip: str):
+def browsing_history_to_df(tiktok_zip: str, record_filter: RecordFilter = NO_FILTER, watchdog: Watchdog | None = None):
 
     out = pd.DataFrame()
 
     try:
-        b = unzipddp.extract_file_from_zip(tiktok_zip, "Follower.txt")
-        b = io.TextIOWrapper(b, encoding='utf-8')
-        text = b.read()
-
-        pattern = re.compile(r"^Date: (.*?)$", re.MULTILINE)
-        matches = re.findall(pattern, text)
-        out = pd.DataFrame(matches, columns=["Date"])
-
+        columns = record_filter.select(BROWSING_HISTORY_COLUMNS)
+        out = pd.DataFrame(iter_browsing_history(tiktok_zip, record_filter, watchdog), columns=columns)
     except Exception as e:
         logger.error(e)
 
     return out
 
 
+def favorite_hashtag_to_df(tiktok_zip: str, record_filter: RecordFilter = NO_FILTER, watchdog: Watchdog | None = None):
+    pattern = re.compile(r"^Date: ([^\n]*)\nHashTag Link(?::|::) ([^\n]*)$", re.MULTILINE)
+    return _extract_records(
+        tiktok_zip, "Favorite HashTags.txt", pattern, ["Tijdstip", "Hashtag url"], "Tijdstip", record_filter, watchdog
+    )
 
-def following_to_df(tiktok_zip: str):
 
-    out = pd.DataFrame()
+def favorite_videos_to_df(tiktok_zip: str, record_filter: RecordFilter = NO_FILTER, watchdog: Watchdog | None = None):
+    pattern = re.compile(r"^Date: ([^\n]*)\nLink: ([^\n]*)$", re.MULTILINE)
+    return _extract_records(
+        tiktok_zip, "Favorite Videos.txt", pattern, ["Tijdstip", "Video"], "Tijdstip", record_filter, watchdog
+    )
 
-    try:
-        b = unzipddp.extract_file_from_zip(tiktok_zip, "Following.txt")
-        b = io.TextIOWrapper(b, encoding='utf-8')
-        text = b.read()
 
-        pattern = re.compile(r"^Date: (.*?)$", re.MULTILINE)
-        matches = re.findall(pattern, text)
-        out = pd.DataFrame(matches, columns=["Date"])
+def follower_to_df(tiktok_zip: str, record_filter: RecordFilter = NO_FILTER, watchdog: Watchdog | None = None):
+    pattern = re.compile(r"^Date: ([^\n]*)$", re.MULTILINE)
+    return _extract_records(tiktok_zip, "Follower.txt", pattern, ["Date"], "Date", record_filter, watchdog)
 
-    except Exception as e:
-        logger.error(e)
 
-    return out
+def following_to_df(tiktok_zip: str, record_filter: RecordFilter = NO_FILTER, watchdog: Watchdog | None = None):
+    pattern = re.compile(r"^Date: ([^\n]*)$", re.MULTILINE)
+    return _extract_records(tiktok_zip, "Following.txt", pattern, ["Date"], "Date", record_filter, watchdog)
 
 
-def hashtag_to_df(tiktok_zip: str):
+def hashtag_to_df(tiktok_zip: str, record_filter: RecordFilter = NO_FILTER, watchdog: Watchdog | None = None):
+    pattern = re.compile(r"^Hashtag Name: ([^\n]*)\nHashtag Link: ([^\n]*)$", re.MULTILINE)
+    return _extract_records(
+        tiktok_zip, "Hashtag.txt", pattern, ["Hashtag naam", "Hashtag url"], None, record_filter, watchdog
+    )
 
-    out = pd.DataFrame()
 
-    try:
-        b = unzipddp.extract_file_from_zip(tiktok_zip, "Hashtag.txt")
-        b = io.TextIOWrapper(b, encoding='utf-8')
-        text = b.read()
+def like_list_to_df(tiktok_zip: str, record_filter: RecordFilter = NO_FILTER, watchdog: Watchdog | None = None):
+    pattern = re.compile(r"^Date: ([^\n]*)\nLink: ([^\n]*)$", re.MULTILINE)
+    return _extract_records(
+        tiktok_zip, "Like List.txt", pattern, ["Tijdstip", "Video"], "Tijdstip", record_filter, watchdog
+    )
 
-        pattern = re.compile(r"^Hashtag Name: (.*?)\nHashtag Link: (.*?)$", re.MULTILINE)
-        matches = re.findall(pattern, text)
-        out = pd.DataFrame(matches, columns=["Hashtag naam", "Hashtag url"])
 
-    except Exception as e:
-        logger.error(e)
+def searches_to_df(tiktok_zip: str, record_filter: RecordFilter = NO_FILTER, watchdog: Watchdog | None = None):
+    pattern = re.compile(r"^Date: ([^\n]*)\nSearch Term: ([^\n]*)$", re.MULTILINE)
+    return _extract_records(
+        tiktok_zip, "Searches.txt", pattern, ["Tijdstip", "Zoekterm"], "Tijdstip", record_filter, watchdog
+    )
 
-    return out
 
+def share_history_to_df(tiktok_zip: str, record_filter: RecordFilter = NO_FILTER, watchdog: Watchdog | None = None):
+    pattern = re.compile(r"^Date: ([^\n]*)\nShared Content: ([^\n]*)\nLink: ([^\n]*)\nMethod: ([^\n]*)$", re.MULTILINE)
+    return _extract_records(
+        tiktok_zip,
+        "Share History.txt",
+        pattern,
+        ["Tijdstip", "Gedeelde inhoud", "Url", "Gedeeld via"],
+        "Tijdstip",
+        record_filter,
+        watchdog,
+    )
 
 
-def like_list_to_df(tiktok_zip: str):
+def settings_to_df(tiktok_zip: str, record_filter: RecordFilter = NO_FILTER, watchdog: Watchdog | None = None):
 
     out = pd.DataFrame()
 
     try:
-        b = unzipddp.extract_file_from_zip(tiktok_zip, "Like List.txt")
-        b = io.TextIOWrapper(b, encoding='utf-8')
+        if not record_filter.select(["Interesses"]):
+            return out
+
+        watchdog = watchdog or Watchdog("Settings.txt")
+        b = unzipddp.extract_file_from_zip(tiktok_zip, "Settings.txt", watchdog.budget.read_size())
+        b = io.TextIOWrapper(io.BytesIO(watchdog.limit_input(b.getvalue())), encoding='utf-8')
         text = b.read()
 
-        pattern = re.compile(r"^Date: (.*?)\nLink: (.*?)$", re.MULTILINE)
-        matches = re.findall(pattern, text)
-        out = pd.DataFrame(matches, columns=["Tijdstip", "Video"])
+        pattern = re.compile(r"^Interests: ([^\n]*)$", re.MULTILINE)
+        match = re.search(pattern, text)
+        if match:
+            interests = match.group(1).split("|")
+            out = pd.DataFrame(interests, columns=["Interesses"])
 
     except Exception as e:
         logger.error(e)
@@ -286,63 +360,162 @@ def like_list_to_df(tiktok_zip: str):
     return out
 
 
-def searches_to_df(tiktok_zip: str):
-
-    out = pd.DataFrame()
+# the trailing colons and whitespace are stripped from the name in parse_direct_messages,
+# a lazy group followed by ":*\s*$" is quadratic in the length of the line
+REGEX_CHAT_HEADER = re.compile(r"^(?:>>>\s*)?Chat History with (.*)$")
+REGEX_MESSAGE_FIELD = re.compile(r"^(Date|From|Content): ?(.*)$")
 
-    try:
-        b = unzipddp.extract_file_from_zip(tiktok_zip, "Searches.txt")
-        b = io.TextIOWrapper(b, encoding='utf-8')
-        text = b.read()
-
-        pattern = re.compile(r"^Date: (.*?)\nSearch Term: (.*?)$", re.MULTILINE)
-        matches = re.findall(pattern, text)
-        out = pd.DataFrame(matches, columns=["Tijdstip", "Zoekterm"])
-
-    except Exception as e:
-        logger.error(e)
-
-    return out
 
+def parse_direct_messages(
+    lines: Iterable[str],
+    include_messages: bool = False,
+    record_filter: RecordFilter = NO_FILTER,
+    watchdog: Watchdog | None = None,
+) -> Iterator[dict[str, Any]]:
+    """
+    Parses the lines of Direct Messages.txt conversation by conversation
 
+    Direct Messages.txt looks like:
 
-def share_history_to_df(tiktok_zip: str):
+    >>> Chat History with username:
+    Date: 2023-01-01 12:00:00
+    From: username
+    Content: hey!
 
-    out = pd.DataFrame()
+    A message ends at the next Date line (or chat header), so its content can span multiple lines,
+    including blank ones and lines that look like a From or Content field.
+    Blank lines at the end of the content are dropped.
 
+    Only the conversation that is currently being parsed is kept in memory.
+    Message bodies are only kept when include_messages is True.
+    Messages outside the time range of record_filter are skipped, conversations without messages
+    in the time range are not yielded. The columns of record_filter are not applied here.
+    Stops when the watchdog says so, a row is a conversation
+    """
+    conversation: dict[str, Any] | None = None
+    # the lines of "Content" are kept as a list, appending to a string in a dict is quadratic
+    message: dict[str, Any] = {}
+    filter_time = record_filter.has_time_range
+
+    n_conversations = 0
+
+    def keep(conversation: dict[str, Any] | None) -> bool:
+        return conversation is not None and (not filter_time or conversation["Aantal berichten"] > 0)
+
+    def within_budget() -> bool:
+        return watchdog is None or watchdog.ok(rows=n_conversations + 1)
+
+    def add_message(conversation: dict[str, Any] | None, message: dict[str, Any]) -> None:
+        if conversation is None or "Date" not in message:
+            return
+
+        date = message["Date"]
+        if filter_time and not record_filter.keep_time(date):
+            return
+
+        conversation["Aantal berichten"] += 1
+        if message.get("From", "") == conversation["Gesprek met"]:
+            conversation["Aantal ontvangen"] += 1
+        else:
+            conversation["Aantal verstuurd"] += 1
+
+        if conversation["Eerste bericht"] == "" or date < conversation["Eerste bericht"]:
+            conversation["Eerste bericht"] = date
+        if date > conversation["Laatste bericht"]:
+            conversation["Laatste bericht"] = date
+
+        if include_messages:
+            content = message.get("Content", [])
+            while len(content) > 1 and content[-1].strip() == "":
+                content.pop()
+            conversation["Berichten"].append(
+                {"Tijdstip": date, "Van": message.get("From", ""), "Bericht": "\n".join(content)}
+            )
+
+    def new_conversation(chat_with: str) -> dict[str, Any]:
+        out: dict[str, Any] = {
+            "Gesprek met": chat_with,
+            "Aantal berichten": 0,
+            "Aantal verstuurd": 0,
+            "Aantal ontvangen": 0,
+            "Eerste bericht": "",
+            "Laatste bericht": "",
+        }
+        if include_messages:
+            out["Berichten"] = []
+        return out
+
+    for line in lines:
+        line = line.rstrip("\r\n")
+
+        header = REGEX_CHAT_HEADER.match(line)
+        if header:
+            add_message(conversation, message)
+            message = {}
+            if keep(conversation):
+                if not within_budget():
+                    return
+                yield conversation
+                n_conversations += 1
+            conversation = new_conversation(header.group(1).rstrip().rstrip(":"))
+            continue
+
+        field = REGEX_MESSAGE_FIELD.match(line)
+        if field and field.group(1) != "Date" and "Content" in message:
+            # Once the content started only a Date line ends the message, "From: " in a body is content
+            field = None
+
+        if field:
+            key, value = field.groups()
+            # A new Date line starts a new message
+            if key == "Date" and "Date" in message:
+                add_message(conversation, message)
+                message = {}
+            message[key] = [value] if key == "Content" else value
+        elif "Content" in message:
+            # Message bodies can span multiple lines, also blank ones
+            message["Content"].append(line)
+        elif line.strip() == "":
+            add_message(conversation, message)
+            message = {}
+
+    add_message(conversation, message)
+    if keep(conversation) and within_budget():
+        yield conversation
+
+
+def direct_messages_per_conversation(
+    tiktok_zip: str,
+    include_messages: bool = False,
+    record_filter: RecordFilter = NO_FILTER,
+    watchdog: Watchdog | None = None,
+) -> Iterator[dict[str, Any]]:
+    """
+    Streams Direct Messages.txt from the zip and yields one dict per conversation
+    """
     try:
-        b = unzipddp.extract_file_from_zip(tiktok_zip, "Share History.txt")
-        b = io.TextIOWrapper(b, encoding='utf-8')
-        text = b.read()
-
-        pattern = re.compile(r"^Date: (.*?)\nShared Content: (.*?)\nLink: (.*?)\nMethod: (.*?)$", re.MULTILINE)
-        matches = re.findall(pattern, text)
-        out = pd.DataFrame(matches, columns=["Tijdstip", "Gedeelde inhoud", "Url", "Gedeeld via"])
-
+        lines = unzipddp.iter_lines_from_zip(tiktok_zip, "Direct Messages.txt", watchdog=watchdog)
+        yield from parse_direct_messages(lines, include_messages, record_filter, watchdog)
     except Exception as e:
         logger.error(e)
 
-    return out
-
 
-def settings_to_df(tiktok_zip: str):
+def direct_messages_to_df(tiktok_zip: str, record_filter: RecordFilter = NO_FILTER, watchdog: Watchdog | None = None):
+    """
+    Per conversation metadata of Direct Messages.txt, message bodies are not included
+    """
 
     out = pd.DataFrame()
 
     try:
-        b = unzipddp.extract_file_from_zip(tiktok_zip, "Settings.txt")
-        b = io.TextIOWrapper(b, encoding='utf-8')
-        text = b.read()
-
-        pattern = re.compile(r"^Interests: (.*?)$", re.MULTILINE)
-        match = re.search(pattern, text)
-        if match:
-            interests = match.group(1).split("|")
-            out = pd.DataFrame(interests, columns=["Interesses"])
+        conversations = list(
+            direct_messages_per_conversation(tiktok_zip, record_filter=record_filter, watchdog=watchdog)
+        )
+        if conversations:
+            out = pd.DataFrame(conversations)
+            out = out[record_filter.select(list(out.columns))]
 
     except Exception as e:
         logger.error(e)
 
     return out
-
-
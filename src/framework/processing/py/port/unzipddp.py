@@ -3,22 +3,26 @@ Contains functions to deal with zipfiles
 """
 
 from pathlib import Path
-from typing import Any, Callable
+from typing import IO, Any, Callable, Iterator
 import logging
 import zipfile
 import json
+import itertools
+import codecs
 import csv
 import io
 
 import pandas as pd
 
 from port.my_exceptions import FileNotFoundInZipError
+from port.budget import Watchdog
 
 logger = logging.getLogger(__name__)
 
-def extract_file_from_zip(zfile: str, file_to_extract: str) -> io.BytesIO:
+def extract_file_from_zip(zfile: str, file_to_extract: str, max_bytes: int = -1) -> io.BytesIO:
     """
     Extracts a specific file from a zipfile buffer
+    max_bytes: read at most this many bytes of the file, -1 reads the whole file
     Function always returns a buffer
     """
     file_to_extract_bytes = io.BytesIO()
@@ -34,7 +38,8 @@ def extract_file_from_zip(zfile: str, file_to_extract: str) -> io.BytesIO:
                 if Path(f).name == file_to_extract:
                     #print('extract_file_from_zip found a message json', f)
 
-                    file_to_extract_bytes = io.BytesIO(zf.read(f))
+                    with zf.open(f, "r") as member:
+                        file_to_extract_bytes = io.BytesIO(member.read(max_bytes))
                     file_found = True
                     break
 
@@ -52,6 +57,109 @@ def extract_file_from_zip(zfile: str, file_to_extract: str) -> io.BytesIO:
         return file_to_extract_bytes
 
 
+def iter_lines_from_zip(
+    zfile: str, file_to_extract: str, encoding: str = "utf-8", watchdog: Watchdog | None = None
+) -> Iterator[str]:
+    """
+    Lazily yields the lines of a specific file in a zipfile
+    The file is decompressed while it is read, it is never loaded in memory as a whole
+
+    watchdog: stop when the time or input budget of the watchdog is exceeded,
+    a line is not read beyond the input budget (a file can consist of one very long line)
+
+    Yields nothing in case the file could not be found or read
+    """
+    try:
+        with zipfile.ZipFile(zfile, "r") as zf:
+            for f in zf.namelist():
+                if Path(f).name == file_to_extract:
+                    with zf.open(f, "r") as member:
+                        if watchdog is None:
+                            yield from io.TextIOWrapper(member, encoding=encoding, errors="replace")
+                        else:
+                            yield from _iter_lines_within_budget(member, encoding, watchdog)
+                    return
+
+        raise FileNotFoundInZipError("File not found in zip")
+
+    except zipfile.BadZipFile as e:
+        logger.error("BadZipFile:  %s", e)
+    except FileNotFoundInZipError as e:
+        logger.error("File not found:  %s: %s", file_to_extract, e)
+    except Exception as e:
+        logger.error("Exception was caught:  %s", e)
+
+
+class _LimitedReader(io.RawIOBase):
+    """
+    Reads at most max_bytes bytes of member, exceeded is set when member has more
+    """
+
+    def __init__(self, member: IO[bytes], max_bytes: int | None) -> None:
+        self.member = member
+        self.max_bytes = max_bytes
+        self.n_read = 0
+        self.exceeded = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = len(buffer)
+        if self.max_bytes is not None:
+            size = min(size, self.max_bytes - self.n_read)
+            if size <= 0:
+                self.exceeded = self.exceeded or len(self.member.read(1)) > 0
+                return 0
+        data = self.member.read(size)
+        buffer[: len(data)] = data
+        self.n_read += len(data)
+        return len(data)
+
+
+def _iter_lines_within_budget(member: IO[bytes], encoding: str, watchdog: Watchdog) -> Iterator[str]:
+    """
+    Yields the lines of member until the input budget is read or the watchdog stops
+    A line is not read beyond the budget, a line that is cut off at the budget is left out
+    """
+    reader = _LimitedReader(member, watchdog.budget.max_input_bytes)
+    stream = io.TextIOWrapper(io.BufferedReader(reader), encoding=encoding, errors="replace")
+    try:
+        # the watchdog is asked per block of lines, that keeps the cost per line low
+        # input_bytes is kept up to date for the progress of the extraction, the budget is checked at the end
+        while watchdog.ok():
+            lines = stream.readlines(65536)
+            watchdog.input_bytes = reader.n_read
+            if reader.exceeded and lines and not lines[-1].endswith("\n"):
+                lines.pop()
+            if not lines:
+                break
+            yield from lines
+    finally:
+        # one byte more than the budget marks that the file was cut off
+        watchdog.ok(input_bytes=reader.n_read + 1 if reader.exceeded else reader.n_read)
+
+
+def member_sizes(zfile: str) -> dict[str, int]:
+    """
+    Uncompressed size in bytes of the files in a zipfile, by file name
+    If a file name occurs more than once the first one counts (like extract_file_from_zip)
+
+    Returns {} in case the zipfile could not be read
+    """
+    sizes: dict[str, int] = {}
+    try:
+        with zipfile.ZipFile(zfile, "r") as zf:
+            for info in zf.infolist():
+                sizes.setdefault(Path(info.filename).name, info.file_size)
+    except zipfile.BadZipFile as e:
+        logger.error("BadZipFile:  %s", e)
+    except Exception as e:
+        logger.error("Exception was caught:  %s", e)
+
+    return sizes
+
+
 def _json_reader_bytes(json_bytes: bytes, encoding: str) -> Any:
     json_bytes_stream = io.BytesIO(json_bytes)
     stream = io.TextIOWrapper(json_bytes_stream, encoding=encoding)
@@ -149,11 +257,106 @@ def read_csv_from_bytes(json_bytes: io.BytesIO) -> list[dict[Any, Any]]:
         return out
 
 
-def read_csv_from_bytes_to_df(json_bytes: io.BytesIO) -> pd.DataFrame:
+def _detect_csv_encoding(csv_bytes: io.BytesIO) -> str:
+    """
+    Detects the encoding from the byte order mark, defaults to utf8
+    The position of the buffer is not changed
+    """
+    position = csv_bytes.tell()
+    start = csv_bytes.read(4)
+    csv_bytes.seek(position)
+
+    if start.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if start.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    return "utf8"
+
+
+def read_csv_columns_from_bytes(
+    csv_bytes: io.BytesIO,
+    columns: list[str] | None = None,
+    chunk_size: int = 10000,
+) -> dict[str, list[Any]]:
+    """
+    Reads csv from io.BytesIO() straight into one list per column
+    Expects input from extract_file_from_zip
+
+    Rows are read in chunks of chunk_size and transposed into the column lists,
+    no dict is created per row. The encoding is detected once from the byte order mark.
+    columns: optional list of columns to keep, other columns are skipped
+
+    Function returns the columns read so far in case of failure
+    """
+    out: dict[str, list[Any]] = {}
+
+    encoding = _detect_csv_encoding(csv_bytes)
+    stream = io.TextIOWrapper(csv_bytes, encoding=encoding, newline="")
+
+    try:
+        reader = csv.reader(stream)
+        header = next(reader, [])
+
+        # in case of duplicate column names the last one wins (like csv.DictReader)
+        positions = {name: i for i, name in enumerate(header)}
+        if columns is not None:
+            positions = {name: positions[name] for name in columns if name in positions}
+
+        out = {name: [] for name in positions}
+        selected = list(positions.values())
+        n_header = len(header)
+
+        while True:
+            chunk = list(itertools.islice(reader, chunk_size))
+            if not chunk:
+                break
+
+            # pad short rows with None (like csv.DictReader), skip empty lines
+            chunk = [
+                row if len(row) >= n_header else row + [None] * (n_header - len(row))
+                for row in chunk
+                if row
+            ]
+            if not chunk:
+                continue
+
+            transposed = list(zip(*chunk))
+            for name, i in zip(positions, selected):
+                out[name].extend(transposed[i])
+
+        logger.debug("succesfully converted csv bytes with encoding %s", encoding)
+
+    except Exception as e:
+        logger.error("%s, could not convert csv bytes", e)
+
+    finally:
+        # do not close the buffer of the caller
+        stream.detach()
+
+    return out
+
+
+def read_csv_from_bytes_to_df(
+    json_bytes: io.BytesIO,
+    columns: list[str] | None = None,
+    infer_dtypes: bool = False,
+) -> pd.DataFrame:
     """
     csv to pd.DataFrame
     expects io.BytesIO as input (from extract_file_from_zip)
+
+    columns: optional list of columns to read
+    infer_dtypes: convert columns that only contain numbers to a numeric dtype
     """
-    return pd.DataFrame(read_csv_from_bytes(json_bytes))
+    df = pd.DataFrame(read_csv_columns_from_bytes(json_bytes, columns))
+
+    if infer_dtypes:
+        for name in df.columns:
+            try:
+                df[name] = pd.to_numeric(df[name])
+            except (ValueError, TypeError):
+                pass
+
+    return df
 
 
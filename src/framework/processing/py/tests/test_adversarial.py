@@ -0,0 +1,47 @@
+import pytest
+
+import port.adversarial as adversarial
+import port.script as script
+import port.tiktok as tiktok
+from port.budget import Budget, Watchdog
+
+SIZE = 200_000
+MAX_SECONDS = 2.0
+
+SPECS = {spec.name: spec for spec in script.TIKTOK_TABLES}
+
+
+@pytest.mark.parametrize("name, file_name, create", adversarial.CASES, ids=[case[0] for case in adversarial.CASES])
+def test_extractors_stay_within_budget(tmp_path, name, file_name, create):
+    zip_path = adversarial.write_case(tmp_path, name, file_name, create(SIZE))
+
+    tables = adversarial.run_case(zip_path, MAX_SECONDS)
+
+    assert tables
+    for table_name, result in tables.items():
+        budget = SPECS[table_name].budget
+        assert "error" not in result, result
+        assert not result["failed"], result
+        assert result["rows"] <= budget.max_rows
+        # one byte more than the budget marks a file that was cut off
+        assert result["input_bytes"] <= budget.max_input_bytes + 1
+
+
+@pytest.mark.parametrize("name, file_name, create", adversarial.CASES, ids=[case[0] for case in adversarial.CASES])
+def test_extractors_stop_at_a_tight_budget(tmp_path, name, file_name, create):
+    zip_path = adversarial.write_case(tmp_path, name, file_name, create(SIZE))
+    budget = Budget(max_seconds=MAX_SECONDS, max_input_bytes=10_000, max_rows=10)
+
+    for spec in script.TIKTOK_TABLES:
+        watchdog = Watchdog(spec.name, budget)
+        df = spec.extract(zip_path, tiktok.NO_FILTER, watchdog)
+        assert len(df) <= budget.max_rows, spec.name
+        assert watchdog.input_bytes <= budget.max_input_bytes + 1, spec.name
+
+
+def test_run_writes_a_report(tmp_path):
+    report = adversarial.run(str(tmp_path), size=10_000, max_seconds=MAX_SECONDS)
+
+    assert report["n_cases"] == len(adversarial.CASES)
+    assert report["n_failed"] == 0
+    assert (tmp_path / "report.json").exists()
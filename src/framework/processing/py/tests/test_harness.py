@@ -0,0 +1,124 @@
+import json
+
+import pytest
+
+import port.harness as harness
+import port.loadtest as loadtest
+import port.script as script
+
+
+@pytest.fixture
+def export(tmp_path):
+    # every session in the browser starts with an empty log
+    script.LOG_STREAM.seek(0)
+    script.LOG_STREAM.truncate()
+    return loadtest.write_synthetic_export(tmp_path / "tiktok.zip", 200)
+
+
+def rows(table: dict) -> list[dict]:
+    """
+    Rows of a table in the format of props.data_frame_to_json as dicts
+    """
+    columns = []
+    for column in table["columns"]:
+        values = table["data"][column]
+        dictionary = table["dictionaries"].get(column)
+        if dictionary is not None:
+            values = [None if code == -1 else dictionary[code] for code in values]
+        columns.append(values)
+    return [dict(zip(table["columns"], row)) for row in zip(*columns)]
+
+
+def donations(commands: list[dict]) -> dict[str, list[dict]]:
+    """
+    Rows of every donated table by the key of the donation
+    """
+    donated = {}
+    for command in commands:
+        if command["__type__"] == "CommandSystemDonate" and command["key"].startswith("TikTok_"):
+            (table,) = json.loads(command["json_string"]).values()
+            donated[command["key"]] = rows(table)
+    return donated
+
+
+def test_drive_runs_the_flow_until_exit(export):
+    steps = harness.drive(harness.default_payloads(export), "test")
+
+    assert steps[-1].command == "CommandSystemExit"
+    assert [step.index for step in steps] == list(range(len(steps)))
+    assert all(step.size > 0 and step.seconds >= 0 for step in steps)
+    names = [step.name for step in steps]
+    assert "PropsUIPageDonation/PropsUIPromptConsentForm" in names
+    assert "TikTok_tiktok_video_browsing_history_0" in names
+
+
+def test_drive_answers_progress_pages(export):
+    steps = harness.drive(harness.default_payloads(export), "test")
+
+    after_progress = [
+        steps[i + 1].payload for i, step in enumerate(steps[:-1]) if step.name.endswith("PropsUIPromptProgress")
+    ]
+    assert after_progress
+    assert set(after_progress) == {"PayloadTrue"}
+
+
+def test_donations_are_compact_tables(export):
+    commands: list[dict] = []
+    harness.drive(harness.default_payloads(export), "test", on_command=commands.append)
+
+    donated = {
+        command["key"]: json.loads(command["json_string"])
+        for command in commands
+        if command["__type__"] == "CommandSystemDonate"
+    }
+    likes = donated["TikTok_tiktok_like_list"]["tiktok_like_list"]
+    assert likes["__version__"] == 2
+    assert likes["columns"] == ["Tijdstip", "Video"]
+    history = donated["TikTok_tiktok_video_browsing_history_0"]["tiktok_video_browsing_history_0"]
+    assert history["__version__"] == 2
+    assert history["rowCount"] == 200
+
+
+def test_deleted_rows_are_not_donated(export):
+    kept: list[dict] = []
+    harness.drive(harness.default_payloads(export), "test", on_command=kept.append)
+    deleted: list[dict] = []
+    payloads = harness.default_payloads(export, {"tiktok_like_list": [0, 1], "tiktok_video_browsing_history": [5]})
+    harness.drive(payloads, "test", on_command=deleted.append)
+
+    before, after = donations(kept), donations(deleted)
+    assert after["TikTok_tiktok_like_list"] == before["TikTok_tiktok_like_list"][2:]
+    history_before = before["TikTok_tiktok_video_browsing_history_0"]
+    assert after["TikTok_tiktok_video_browsing_history_0"] == history_before[:5] + history_before[6:]
+
+
+def test_previewed_tables_keep_their_donation_key(tmp_path):
+    n = script.PREVIEW_ROWS + 100
+    export = loadtest.write_synthetic_export(tmp_path / "tiktok.zip", n)
+    newest = n - 1
+    payloads = harness.default_payloads(export, {"tiktok_like_list": [newest]})
+    commands: list[dict] = []
+    harness.drive(payloads, "test", on_command=commands.append)
+
+    likes = donations(commands)["TikTok_tiktok_like_list"]
+    assert len(likes) == n - 1
+
+
+def test_drive_raises_when_payloads_run_out(export):
+    with pytest.raises(harness.HarnessError):
+        harness.drive(harness.default_payloads(export)[:2], "test")
+
+
+def test_serialized_size_is_utf8_bytes():
+    command = {"__type__": "CommandSystemDonate", "json_string": "café"}
+    assert harness.serialized_size(command) == len(json.dumps(command).encode("utf-8"))
+
+
+def test_report_ends_with_totals():
+    steps = [
+        harness.Step(0, "CommandUIRender", "a", "None", 0.5, 10),
+        harness.Step(1, "CommandSystemExit", "b", "PayloadVoid", 0.25, 5),
+    ]
+    lines = harness.report(steps).splitlines()
+    assert len(lines) == 4
+    assert lines[-1].split() == ["total", "750.00", "15"]
@@ -0,0 +1,29 @@
+import port.tiktok as tiktok
+
+DIRECT_MESSAGES = """>>> Chat History with bob:
+Date: 2023-01-01 10:00:00
+From: bob
+Content: first line
+From: me sneaky
+
+Content: last line
+Date: 2023-01-02 10:00:00
+From: me
+Content: hoi
+"""
+
+
+def test_direct_message_content_ends_at_the_next_date():
+    conversations = list(tiktok.parse_direct_messages(DIRECT_MESSAGES.splitlines(True), True))
+
+    assert len(conversations) == 1
+    conversation = conversations[0]
+    assert conversation["Berichten"] == [
+        {
+            "Tijdstip": "2023-01-01 10:00:00",
+            "Van": "bob",
+            "Bericht": "first line\nFrom: me sneaky\n\nContent: last line",
+        },
+        {"Tijdstip": "2023-01-02 10:00:00", "Van": "me", "Bericht": "hoi"},
+    ]
+    assert conversation["Aantal berichten"] == 2
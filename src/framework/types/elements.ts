@@ -390,6 +390,8 @@ export interface TableContext {
   deletedRows: string[][]
   visualizations?: any[]
   folded: boolean
+  // rows in the full table when the body is a preview
+  totalRowCount?: number
 }
 
 export type TableWithContext = TableContext & PropsUITable
@@ -430,6 +432,7 @@ export function isTranslatable(arg: any): arg is Translatable {
 
 export interface PropsUIFooter {
   __type__: 'PropsUIFooter'
+  progressPercentage?: number | null
 }
 export function isPropsUIFooter (arg: any): arg is PropsUIFooter {
   return isInstanceOf<PropsUIFooter>(arg, 'PropsUIFooter', [])
@@ -10,13 +10,15 @@ export type PropsUIPrompt =
   | PropsUIPromptRadioInput
   | PropsUIPromptConsentForm
   | PropsUIPromptConfirm
+  | PropsUIPromptProgress
 
 export function isPropsUIPrompt(arg: any): arg is PropsUIPrompt {
   return (
     isPropsUIPromptFileInput(arg) ||
     isPropsUIPromptRadioInput(arg) ||
     isPropsUIPromptConsentForm(arg) ||
-    isPropsUIPromptQuestionnaire(arg)
+    isPropsUIPromptQuestionnaire(arg) ||
+    isPropsUIPromptProgress(arg)
   )
 }
 
@@ -30,6 +32,15 @@ export function isPropsUIPromptConfirm(arg: any): arg is PropsUIPromptConfirm {
   return isInstanceOf<PropsUIPromptConfirm>(arg, "PropsUIPromptConfirm", ["text", "ok", "cancel"])
 }
 
+export interface PropsUIPromptProgress {
+  __type__: "PropsUIPromptProgress"
+  description: Text
+  message: string
+}
+export function isPropsUIPromptProgress(arg: any): arg is PropsUIPromptProgress {
+  return isInstanceOf<PropsUIPromptProgress>(arg, "PropsUIPromptProgress", ["description", "message"])
+}
+
 export interface PropsUIPromptFileInput {
   __type__: "PropsUIPromptFileInput"
   description: Text
@@ -68,6 +79,8 @@ export interface PropsUIPromptConsentFormTable {
   data_frame: any
   visualizations: any
   folded: boolean
+  // rows in the full table when data_frame is a preview
+  total_rows?: number | null
 }
 export function isPropsUIPromptConsentFormTable(arg: any): arg is PropsUIPromptConsentFormTable {
   return isInstanceOf<PropsUIPromptConsentFormTable>(arg, "PropsUIPromptConsentFormTable", [
@@ -23,11 +23,16 @@ export const TableItems = ({ table, searchedTable, handleUndo, locale }: Props):
   const totalLabel = total.toLocaleString(locale, { useGrouping: true })
   const searchLabel = searched.toLocaleString(locale, { useGrouping: true })
   const deletedLabel = deleted.toLocaleString('en', { useGrouping: true }) + ' ' + text.deleted
+  // the table is a preview of a larger table, show the size of the full table
+  const totalRowCount = table.totalRowCount
+  const previewLabel = totalRowCount !== undefined
+    ? text.previewOf + ' ' + (totalRowCount - deleted).toLocaleString(locale, { useGrouping: true }) + ' ' + text.rows
+    : ''
 
   function rowsLabel (): string {
     if (n === 0) return text.noData
-    if (searched < n) return searchLabel + ' / ' + nLabel + ' ' + text.rows
-    return nLabel + ' ' + text.rows
+    const label = searched < n ? searchLabel + ' / ' + nLabel + ' ' + text.rows : nLabel + ' ' + text.rows
+    return previewLabel !== '' ? label + ' (' + previewLabel + ')' : label
   }
 
   return (
@@ -83,5 +88,6 @@ const translations = {
   columns: new TextBundle().add('en', 'columns').add('nl', 'kolommen'),
   rows: new TextBundle().add('en', 'rows').add('nl', 'rijen'),
   noData: new TextBundle().add('en', 'no data').add('nl', 'geen data'),
-  deleted: new TextBundle().add('en', 'deleted').add('nl', 'verwijderd')
+  deleted: new TextBundle().add('en', 'deleted').add('nl', 'verwijderd'),
+  previewOf: new TextBundle().add('en', 'preview of').add('nl', 'voorbeeld van')
 }
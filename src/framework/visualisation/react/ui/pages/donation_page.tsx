@@ -8,14 +8,17 @@ import {
     isPropsUIPromptConsentForm,
     isPropsUIPromptFileInput,
     isPropsUIPromptRadioInput,
-    isPropsUIPromptQuestionnaire 
+    isPropsUIPromptQuestionnaire,
+    isPropsUIPromptProgress
 } from '../../../../types/prompts'
 import { ReactFactoryContext } from '../../factory'
 import { ForwardButton } from '../elements/button'
+import { Progress as ProgressBar } from '../elements/progress'
 import { Title1 } from '../elements/text'
 import { Confirm } from '../prompts/confirm'
 import { ConsentForm } from '../prompts/consent_form'
 import { FileInput } from '../prompts/file_input'
+import { Progress } from '../prompts/progress'
 import { Questionnaire } from '../prompts/questionnaire'
 import { RadioInput } from '../prompts/radio_input'
 import { Footer } from './templates/footer'
@@ -45,6 +48,9 @@ export const DonationPage = (props: Props): JSX.Element => {
     if (isPropsUIPromptQuestionnaire(body)) {
       return <Questionnaire {...body} {...context} />
     }
+    if (isPropsUIPromptProgress(body)) {
+      return <Progress {...body} {...context} />
+    }
     throw new TypeError('Unknown body type')
   }
 
@@ -53,8 +59,16 @@ export const DonationPage = (props: Props): JSX.Element => {
   }
 
   function renderFooter (props: Props): JSX.Element | undefined {
+    const progressPercentage = props.footer?.progressPercentage
+    const progress = progressPercentage != null ? <ProgressBar percentage={progressPercentage} /> : undefined
+
+    // the progress page resolves itself, there is nothing to skip
+    if (isPropsUIPromptProgress(props.body)) {
+      return <Footer left={progress} />
+    }
     if (props.footer != null) {
       return <Footer
+      left={progress}
       right={
         <div className='flex flex-row'>
           <div className='flex-grow' />
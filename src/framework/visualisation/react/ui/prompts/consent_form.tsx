@@ -1,4 +1,4 @@
-import { assert, Weak } from "../../../../helpers"
+import { Weak } from "../../../../helpers"
 import {
   PropsUITable,
   PropsUITableBody,
@@ -25,7 +25,6 @@ type Props = Weak<PropsUIPromptConsentForm> & ReactFactoryContext
 export const ConsentForm = (props: Props): JSX.Element => {
   useUnloadWarning()
   const [tables, setTables] = useState<TableWithContext[]>(() => parseTables(props.tables))
-  const [metaTables, setMetaTables] = useState<TableWithContext[]>(() => parseTables(props.metaTables))
   const { locale, resolve } = props
   const { description, donateQuestion, donateButton, cancelButton } = prepareCopy(props)
   const [isDonating, setIsDonating] = useState(false)
@@ -38,7 +37,6 @@ export const ConsentForm = (props: Props): JSX.Element => {
     }
     setIsDonating(false)
     setTables(parseTables(props.tables))
-    setMetaTables(parseTables(props.metaTables))
   }, [props.tables])
 
   const updateTable = useCallback((tableId: string, table: TableWithContext) => {
@@ -85,6 +83,34 @@ export const ConsentForm = (props: Props): JSX.Element => {
     return result
   }
 
+  // Tables with a __version__ use the compact format: one array per column,
+  // dictionary encoded columns contain indices into their dictionary (-1 is null)
+  function isCompactDataFrame(dataFrame: any): boolean {
+    return dataFrame.__version__ === 2
+  }
+
+  function compactColumnValues(dataFrame: any, column: string): any[] {
+    const values = dataFrame.data[column]
+    const dictionary = dataFrame.dictionaries?.[column]
+    if (dictionary === undefined) {
+      return values
+    }
+    return values.map((index: number) => (index === -1 ? null : dictionary[index]))
+  }
+
+  function compactRows(dataFrame: any): PropsUITableRow[] {
+    const columns: any[][] = dataFrame.columns.map((column: string) => compactColumnValues(dataFrame, column))
+    const result: PropsUITableRow[] = []
+    // rowIds are only sent when the ids are not the positions (e.g. in a preview)
+    const rowIds: number[] | undefined = dataFrame.rowIds
+    for (let row = 0; row < dataFrame.rowCount; row++) {
+      const id = rowIds !== undefined ? `${rowIds[row]}` : `${row}`
+      const cells = columns.map((values) => String(values[row]))
+      result.push({ id, cells })
+    }
+    return result
+  }
+
   function parseTables(tablesData: PropsUIPromptConsentFormTable[]): Array<PropsUITable & TableContext> {
     return tablesData.map((table) => parseTable(table))
   }
@@ -96,14 +122,15 @@ export const ConsentForm = (props: Props): JSX.Element => {
       tableData.description !== undefined ? Translator.translate(tableData.description, props.locale) : ""
     const deletedRowCount = 0
     const dataFrame = JSON.parse(tableData.data_frame)
-    const headCells = columnNames(dataFrame).map((column: string) => column)
+    const compact = isCompactDataFrame(dataFrame)
+    const headCells: string[] = compact ? dataFrame.columns : columnNames(dataFrame)
     const head: PropsUITableHead = {
       __type__: "PropsUITableHead",
       cells: headCells,
     }
     const body: PropsUITableBody = {
       __type__: "PropsUITableBody",
-      rows: rows(dataFrame),
+      rows: compact ? compactRows(dataFrame) : rows(dataFrame),
     }
     return {
       __type__: "PropsUITable",
@@ -118,6 +145,7 @@ export const ConsentForm = (props: Props): JSX.Element => {
       deletedRows: [],
       visualizations: tableData.visualizations,
       folded: tableData.folded || false,
+      totalRowCount: tableData.total_rows ?? undefined,
     }
   }
 
@@ -131,21 +159,15 @@ export const ConsentForm = (props: Props): JSX.Element => {
     resolve?.({ __type__: "PayloadFalse", value: false })
   }
 
+  // Only the ids of the deleted rows are sent back, Python still holds the tables.
+  // Row ids are the positions of the rows in the table as it was rendered, or its rowIds
   function serializeConsentData(): string {
-    const array = serializeTables().concat(serializeMetaData())
-    return JSON.stringify(array)
-  }
-
-  function serializeMetaData(): any[] {
-    return serializeMetaTables().concat(serializeDeletedMetaData())
-  }
-
-  function serializeTables(): any[] {
-    return tables.map((table) => serializeTable(table))
-  }
-
-  function serializeMetaTables(): any[] {
-    return metaTables.map((table) => serializeTable(table))
+    const deletedRows = _.fromPairs(
+      tables
+        .filter(({ deletedRowCount }) => deletedRowCount > 0)
+        .map(({ id, deletedRows }) => [id, _.uniq(_.flatten(deletedRows)).map(Number)])
+    )
+    return JSON.stringify({ deletedRows, ...serializeDeletedMetaData() })
   }
 
   function serializeDeletedMetaData(): any {
@@ -157,21 +179,6 @@ export const ConsentForm = (props: Props): JSX.Element => {
     return { user_omissions: data }
   }
 
-  function serializeTable({ id, head, body: { rows } }: PropsUITable): any {
-    const data = rows.map((row) => serializeRow(row, head))
-    return { [id]: data }
-  }
-
-  function serializeRow(row: PropsUITableRow, head: PropsUITableHead): any {
-    assert(
-      row.cells.length === head.cells.length,
-      `Number of cells in row (${row.cells.length}) should be equals to number of cells in head (${head.cells.length})`
-    )
-    const keys = head.cells.map((cell) => cell)
-    const values = row.cells.map((cell) => cell)
-    return _.fromPairs(_.zip(keys, values))
-  }
-
   return (
     <>
       <div className="max-w-3xl">
@@ -0,0 +1,41 @@
+import { useEffect } from 'react'
+import { Weak } from '../../../../helpers'
+import { ReactFactoryContext } from '../../factory'
+import { PropsUIPromptProgress } from '../../../../types/prompts'
+import { Translator } from '../../../../translator'
+import { BodyLarge } from '../elements/text'
+import { Spinner } from '../elements/spinner'
+
+type Props = Weak<PropsUIPromptProgress> & ReactFactoryContext
+
+export const Progress = (props: Props): JSX.Element => {
+  const { resolve } = props
+  const { description, message } = prepareCopy(props)
+
+  // The script only shows its progress, resolve as soon as the page is shown so it can continue
+  useEffect(() => {
+    resolve?.({ __type__: 'PayloadTrue', value: true })
+  })
+
+  return (
+    <>
+      <BodyLarge text={description} margin='mb-4' />
+      <div className='flex flex-row items-center gap-4'>
+        <Spinner />
+        <BodyLarge text={message} margin='' />
+      </div>
+    </>
+  )
+}
+
+interface Copy {
+  description: string
+  message: string
+}
+
+function prepareCopy ({ description, message, locale }: Props): Copy {
+  return {
+    description: Translator.translate(description, locale),
+    message
+  }
+}